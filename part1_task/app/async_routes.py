@@ -0,0 +1,248 @@
+# app/async_routes.py
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request, Response, status
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from .database import get_async_db, lock_for_write, DELETE_CHUNK_SIZE, DELETE_CHUNK_PAUSE
+from . import models, schemas, fieldsets, batching, cache, profiling, serialization, stats
+
+# AsyncSession versions of the CRUD routes in main.py, enabled with USE_ASYNC_DB.
+# Lazy loads are not available on an AsyncSession, so User.orders is loaded up
+# front with selectinload() whenever the response needs it.
+router = APIRouter(route_class=profiling.ProfiledRoute)
+
+ORDER_STATS_COLUMNS = (
+    models.Order.user_id, models.Order.product_name, models.Order.quantity, models.Order.order_date
+)
+
+@router.post("/users/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        db_user = models.User(name=user.name, email=user.email, orders=[])
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user, attribute_names=["created_at"])
+        return serialization.json_response(
+            serialization.user_to_dict(db_user), status.HTTP_201_CREATED, serialization.USER
+        )
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
+
+@router.get("/users/{user_id}", response_model=schemas.User)
+async def read_user(
+    request: Request,
+    user_id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    selected = fieldsets.parse_user_fields(fields, include)
+    if selected is None:
+        entry = cache.lookup(cache.user_key(user_id))
+        if entry is not None:
+            return cache.entry_response(request, entry)
+    since = cache.generation()
+
+    stmt = select(models.User).where(models.User.id == user_id)
+    if fieldsets.wants_orders(selected):
+        stmt = stmt.options(selectinload(models.User.orders))
+
+    db_user = (await db.execute(stmt)).scalar_one_or_none()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if selected is None:
+        entry = cache.store(cache.user_key(user_id), fieldsets.user_to_dict(db_user, None), since=since)
+        return cache.entry_response(request, entry)
+    return fieldsets.user_response(db_user, selected)
+
+@router.put("/users/{user_id}", response_model=schemas.User)
+async def update_user(user_id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_async_db)):
+    update_data = user.model_dump(exclude_unset=True)
+    if update_data:
+        stmt = (
+            update(models.User)
+            .where(models.User.id == user_id)
+            .values(**update_data)
+            .returning(models.User)
+        )
+    else:
+        stmt = select(models.User).where(models.User.id == user_id)
+
+    try:
+        db_user = (await db.scalars(stmt.options(selectinload(models.User.orders)))).first()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Email already exists"
+        )
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await db.commit()
+    cache.invalidate_user(user_id)
+    return serialization.json_response(serialization.user_to_dict(db_user), adapter=serialization.USER)
+
+async def _purge_user(bind, user_id: int) -> None:
+    while True:
+        async with AsyncSession(bind=bind) as db:
+            # Holding the user row keeps orders from being added until commit
+            await db.run_sync(lock_for_write)
+            await db.execute(select(models.User.id).where(models.User.id == user_id).with_for_update())
+            chunk = (
+                select(models.Order.id)
+                .where(models.Order.user_id == user_id)
+                .limit(DELETE_CHUNK_SIZE)
+            )
+            deleted = (await db.execute(
+                delete(models.Order)
+                .where(models.Order.id.in_(chunk))
+                .returning(*ORDER_STATS_COLUMNS)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await stats.apply_async(db, removed=deleted)
+            last = len(deleted) < DELETE_CHUNK_SIZE
+            if last:
+                # In the same transaction as the last chunk: the cascade then
+                # has no orders left to remove behind the aggregates' back
+                await db.execute(delete(models.User).where(models.User.id == user_id))
+            await db.commit()
+        cache.invalidate_user(user_id, orders=last)
+        if last:
+            break
+        await asyncio.sleep(DELETE_CHUNK_PAUSE)
+
+@router.delete(
+    "/users/{user_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"description": "Deletion scheduled in the background"}}
+)
+async def delete_user(
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    if background:
+        if await db.get(models.User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        background_tasks.add_task(_purge_user, db.bind, user_id)
+        return Response(status_code=status.HTTP_202_ACCEPTED)
+
+    await db.run_sync(lock_for_write)
+    if await db.scalar(select(models.User.id).where(models.User.id == user_id).with_for_update()) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await db.execute(stats.remove_user_orders(user_id))
+    await db.execute(delete(models.User).where(models.User.id == user_id))
+    await db.commit()
+    cache.invalidate_user(user_id, orders=True)
+    return None
+
+@router.post("/orders/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
+async def create_order(order: schemas.OrderCreate, user_id: int, db: AsyncSession = Depends(get_async_db)):
+    if batching.order_batcher is not None:
+        future = batching.order_batcher.submit({**order.model_dump(), "user_id": user_id})
+        try:
+            row = await asyncio.wrap_future(future)
+        except IntegrityError as e:
+            if "foreign key" in str(e.orig).lower():
+                raise HTTPException(status_code=404, detail="User not found")
+            raise
+        cache.invalidate_user(user_id)
+        return serialization.json_response(row, status.HTTP_201_CREATED, serialization.ORDER)
+
+    try:
+        db_order = (await db.scalars(
+            insert(models.Order)
+            .values(**order.model_dump(), user_id=user_id)
+            .returning(models.Order)
+        )).one()
+    except IntegrityError as e:
+        await db.rollback()
+        if "foreign key" in str(e.orig).lower():
+            raise HTTPException(status_code=404, detail="User not found")
+        raise
+
+    await stats.apply_async(db, added=[db_order])
+    await db.commit()
+    cache.invalidate_user(user_id)
+    return serialization.json_response(
+        serialization.order_to_dict(db_order), status.HTTP_201_CREATED, serialization.ORDER
+    )
+
+@router.get("/orders/{order_id}", response_model=schemas.Order)
+async def read_order(request: Request, order_id: int, db: AsyncSession = Depends(get_async_db)):
+    entry = cache.lookup(cache.order_key(order_id))
+    if entry is not None:
+        return cache.entry_response(request, entry)
+    since = cache.generation()
+
+    db_order = await db.get(models.Order, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    entry = cache.store(
+        cache.order_key(order_id),
+        serialization.order_to_dict(db_order),
+        tags=[cache.user_orders_tag(db_order.user_id)],
+        since=since
+    )
+    return cache.entry_response(request, entry)
+
+async def _update_order(db: AsyncSession, order_id: int, values: dict):
+    if values:
+        # The aggregates move from the old values to the new ones, so a
+        # concurrent writer must not change the row in between
+        await db.run_sync(lock_for_write)
+        old = (await db.execute(
+            select(*ORDER_STATS_COLUMNS).where(models.Order.id == order_id).with_for_update()
+        )).first()
+        if old is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        db_order = (await db.scalars(
+            update(models.Order)
+            .where(models.Order.id == order_id)
+            .values(**values)
+            .returning(models.Order)
+        )).one()
+        await stats.apply_async(db, removed=[old], added=[db_order])
+    else:
+        db_order = (await db.scalars(select(models.Order).where(models.Order.id == order_id))).first()
+        if db_order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+    await db.commit()
+    cache.invalidate_order(order_id, db_order.user_id)
+    return serialization.json_response(serialization.order_to_dict(db_order), adapter=serialization.ORDER)
+
+@router.put("/orders/{order_id}", response_model=schemas.Order)
+async def update_order(order_id: int, order: schemas.OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    return await _update_order(db, order_id, order.model_dump())
+
+@router.patch("/orders/{order_id}", response_model=schemas.Order)
+async def patch_order(order_id: int, order: schemas.OrderUpdate, db: AsyncSession = Depends(get_async_db)):
+    return await _update_order(db, order_id, order.model_dump(exclude_unset=True))
+
+@router.delete("/orders/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    deleted = (await db.execute(
+        delete(models.Order)
+        .where(models.Order.id == order_id)
+        .returning(*ORDER_STATS_COLUMNS)
+    )).first()
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    await stats.apply_async(db, removed=[deleted])
+    await db.commit()
+    cache.invalidate_order(order_id, deleted.user_id)
+    return None
@@ -0,0 +1,147 @@
+# app/batching.py
+"""
+Group commit for POST /orders/.
+
+On SQLite every commit waits for the disk, so one transaction per request
+caps the insert rate well below what the database can otherwise do. With
+WRITE_BATCHING=true, create_order hands its row to a WriteBatcher instead:
+a single writer thread collects rows for up to WRITE_BATCH_WINDOW_MS (or
+until WRITE_BATCH_MAX_ROWS are waiting), inserts them with one multi-row
+INSERT ... RETURNING and commits once. Each caller blocks on its own future
+and gets back its generated row or the error for its row alone.
+
+Rows whose user does not exist are inserted one at a time after the batch,
+so they fail with the database's own IntegrityError without taking the rest
+of the batch down with them.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import metrics, models, serialization, stats
+
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "false").lower() in ("1", "true", "yes")
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2")) / 1000
+WRITE_BATCH_MAX_ROWS = int(os.getenv("WRITE_BATCH_MAX_ROWS", "500"))
+
+BATCH_ROWS = metrics.registry.register(metrics.Histogram(
+    "db_write_batch_rows", "Rows committed per group-commit batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+))
+
+# RETURNING in schemas.Order field order, so rows serialize as-is
+ORDER_RETURNING = tuple(getattr(models.Order, name) for name in serialization.ORDER_COLUMNS)
+
+_STOP = object()
+
+class WriteBatcher:
+    def __init__(self, bind, window: float = WRITE_BATCH_WINDOW, max_rows: int = WRITE_BATCH_MAX_ROWS):
+        self.bind = bind
+        self.window = window
+        self.max_rows = max_rows
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, values: dict) -> Future:
+        """Queue an order row; the future resolves to its dict once committed"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="write-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((values, future))
+        return future
+
+    def close(self) -> None:
+        """Flush what is queued and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _collect(self) -> Tuple[List[tuple], bool]:
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        # The window opens with the first row; rows already queued are taken at once
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_rows:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: List[tuple]) -> None:
+        results = []
+        try:
+            with Session(bind=self.bind) as db:
+                user_ids = {values["user_id"] for values, _ in batch}
+                known = set(db.scalars(select(models.User.id).where(models.User.id.in_(user_ids))))
+                grouped = [item for item in batch if item[0]["user_id"] in known]
+                single = [item for item in batch if item[0]["user_id"] not in known]
+
+                if grouped:
+                    try:
+                        rows = _insert(db, [values for values, _ in grouped])
+                        db.commit()
+                        results.extend((future, dict(row._mapping)) for (_, future), row in zip(grouped, rows))
+                    except IntegrityError:
+                        # A user was deleted since the check; fall back to one row at a time
+                        db.rollback()
+                        single = batch
+
+                for values, future in single:
+                    try:
+                        row = _insert(db, [values])[0]
+                        db.commit()
+                        results.append((future, dict(row._mapping)))
+                    except Exception as e:
+                        db.rollback()
+                        results.append((future, e))
+        except Exception as e:
+            # Callers must never be left waiting, whatever went wrong
+            resolved = {id(future) for future, _ in results}
+            results.extend((future, e) for _, future in batch if id(future) not in resolved)
+
+        BATCH_ROWS.observe(len(batch))
+        for future, result in results:
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+def _insert(db: Session, rows: List[dict]) -> list:
+    result = db.execute(insert(models.Order).returning(*ORDER_RETURNING), rows).all()
+    # Ids are assigned in VALUES order, so sorting restores submission order
+    result.sort(key=lambda row: row.id)
+    stats.apply(db, added=result)
+    return result
+
+order_batcher: Optional[WriteBatcher] = None
+if WRITE_BATCHING:
+    from .database import engine
+
+    order_batcher = WriteBatcher(engine)
+    atexit.register(order_batcher.close)
@@ -0,0 +1,315 @@
+# app/cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+from . import serialization
+
+# Read-through cache for GET /users/{id} and GET /orders/{id}. Entries hold the
+# serialized JSON body and its ETag, so a hit skips both the query and the
+# serialization. Keys are "user:<id>" and "order:<id>"; order entries are
+# tagged with their owner so deleting a user drops their orders as well.
+#
+# A read that loaded its row before a concurrent write committed must not put
+# the old payload back after the write invalidated it. Every invalidation bumps
+# a generation counter and records it on the keys and tags it dropped; a read
+# takes the generation before it queries, and its store is skipped when the key
+# or one of its tags was invalidated since.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def order_key(order_id: int) -> str:
+    return f"order:{order_id}"
+
+def user_orders_tag(user_id: int) -> str:
+    return f"user:{user_id}:orders"
+
+class CacheBackend:
+    """Interface shared by the cache backends"""
+
+    name = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        self.misses += 1
+        return None
+
+    def generation(self) -> int:
+        return 0
+
+    def set(self, key: str, value: dict, tags: Iterable[str] = (), since: Optional[int] = None) -> None:
+        pass
+
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def invalidate_tag(self, tag: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def size(self) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": self.size(),
+        }
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache with a per-entry TTL and a bound on the entry count"""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._generation = 0
+        # key or tag -> generation it was last invalidated at, bounded like the
+        # entries; names that fell off count as invalidated at _floor
+        self._invalidated = OrderedDict()
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, key: str, value: dict, tags: Iterable[str] = (), since: Optional[int] = None) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            if since is not None and self._invalidated_since(since, key, *tags):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            self._mark(*keys)
+            for key in keys:
+                self._remove(key)
+
+    def invalidate_tag(self, tag: str) -> None:
+        with self._lock:
+            self._mark(tag)
+            for key in self._tags.pop(tag, set()):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.evictions = 0
+            super().clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "maxsize": self.maxsize, "ttl": self.ttl, "evictions": self.evictions}
+
+    def _mark(self, *names: str) -> None:
+        self._generation += 1
+        for name in names:
+            self._invalidated[name] = self._generation
+            self._invalidated.move_to_end(name)
+        while len(self._invalidated) > self.maxsize:
+            _, self._floor = self._invalidated.popitem(last=False)
+
+    def _invalidated_since(self, since: int, *names: str) -> bool:
+        return any(self._invalidated.get(name, self._floor) > since for name in names)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+# KEYS: the entry, its marker, then each tag set followed by its marker
+# ARGV: since (-1 to skip the check), value, TTL in ms, key
+REDIS_SET_SCRIPT = """
+local since = tonumber(ARGV[1])
+if since >= 0 then
+    for i = 2, #KEYS, 2 do
+        local marked = redis.call('GET', KEYS[i])
+        if marked and tonumber(marked) > since then
+            return 0
+        end
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+for i = 3, #KEYS, 2 do
+    redis.call('SADD', KEYS[i], ARGV[4])
+    redis.call('PEXPIRE', KEYS[i], ARGV[3])
+end
+return 1
+"""
+
+# KEYS: the generation counter, then each key followed by its marker
+# ARGV: TTL in ms; a read still in flight after that long may store stale data
+REDIS_INVALIDATE_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+for i = 2, #KEYS, 2 do
+    redis.call('DEL', KEYS[i])
+    redis.call('SET', KEYS[i + 1], generation, 'PX', ARGV[1])
+end
+return generation
+"""
+
+class RedisCache(CacheBackend):
+    """Cache shared between workers; hit/miss counters are per process"""
+
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_REDIS_URL, ttl: float = CACHE_TTL, prefix: str = "api:"):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        # Both run as scripts so the generation check and the write are atomic
+        # across workers
+        self._set = self.client.register_script(REDIS_SET_SCRIPT)
+        self._invalidate = self.client.register_script(REDIS_INVALIDATE_SCRIPT)
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def generation(self) -> int:
+        return int(self.client.get(self.prefix + "generation") or 0)
+
+    def set(self, key: str, value: dict, tags: Iterable[str] = (), since: Optional[int] = None) -> None:
+        names = [self.prefix + key, self._marker(key)]
+        for tag in tags:
+            names += [self.prefix + tag, self._marker(tag)]
+        self._set(keys=names, args=[-1 if since is None else since, json.dumps(value), int(self.ttl * 1000), key])
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            names = [self.prefix + "generation"]
+            for key in keys:
+                names += [self.prefix + key, self._marker(key)]
+            self._invalidate(keys=names, args=[int(self.ttl * 1000)])
+
+    def invalidate_tag(self, tag: str) -> None:
+        keys = [key.decode() for key in self.client.smembers(self.prefix + tag)]
+        self.delete(tag, *keys)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+        super().clear()
+
+    def size(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+    def _marker(self, name: str) -> str:
+        return self.prefix + "invalidated:" + name
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    if backend == "memory":
+        return LRUCache()
+    if backend == "redis":
+        return RedisCache()
+    if backend == "none":
+        return CacheBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+backend = create_cache()
+
+def lookup(key: str) -> Optional[dict]:
+    return backend.get(key)
+
+def generation() -> int:
+    """Take before querying; pass to store() as since"""
+    return backend.generation()
+
+def store(
+    key: str, payload: dict, tags: Iterable[str] = (), save: bool = True, since: Optional[int] = None
+) -> dict:
+    """
+    Build the entry for a payload, and cache it unless save is False or the
+    key or one of the tags was invalidated after generation since
+    """
+    body = serialization.dumps(payload)
+    entry = {"body": body.decode(), "etag": '"' + hashlib.sha1(body).hexdigest() + '"'}
+    if save:
+        backend.set(key, entry, tags, since)
+    return entry
+
+def entry_response(request: Request, entry: dict) -> Response:
+    """Answer from a cache entry, with 304 when the client already has it"""
+    headers = {"ETag": entry["etag"]}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if "*" in tags or entry["etag"] in tags or f"W/{entry['etag']}" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+def invalidate_user(user_id: int, orders: bool = False) -> None:
+    backend.delete(user_key(user_id))
+    if orders:
+        backend.invalidate_tag(user_orders_tag(user_id))
+
+def invalidate_order(order_id: int, user_id: Optional[int]) -> None:
+    # The user payload embeds its orders, so it goes stale with them
+    backend.delete(order_key(order_id))
+    if user_id is not None:
+        backend.delete(user_key(user_id))
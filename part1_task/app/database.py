@@ -1,23 +1,244 @@
 # app/database.py
-from sqlalchemy import create_engine
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-# You can change this to PostgreSQL URL later
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+from .ratelimit import client_id
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Any SQLAlchemy URL works; sqlite:// and postgresql:// URLs get tuned profiles
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+
+# Read engines for GET routes (get_read_db): PostgreSQL replicas, or read-only
+# connections to the SQLite file, e.g. sqlite:///file:./test.db?mode=ro&uri=true
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+# After a write, the same client reads from the primary for this long
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_MS", "2000")) / 1000
+
+# Serve the CRUD routes from AsyncSession handlers instead of the threadpool
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "false").lower() in ("1", "true", "yes")
+
+# SQLite profile: WAL lets readers proceed while a writer commits, and
+# synchronous=NORMAL only fsyncs at checkpoints, which is safe under WAL
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
+# PostgreSQL profile
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Chunked background deletes of large accounts (DELETE /users/{id}?background=true)
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", "1000"))
+DELETE_CHUNK_PAUSE = float(os.getenv("DELETE_CHUNK_PAUSE_MS", "10")) / 1000
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite profile to every new DBAPI connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # SQLite ignores FOREIGN KEY clauses unless this is set per connection
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def _postgres_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, tuned: bool = True, **kwargs):
+    """Create a sync engine using the profile that matches the URL's backend"""
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+        db_engine = create_engine(url, **kwargs)
+        if tuned:
+            event.listen(db_engine, "connect", set_sqlite_pragmas)
+        return db_engine
+
+    if url.startswith("postgresql") and tuned:
+        options = _postgres_options()
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+        kwargs = {**options, **kwargs}
+    return create_engine(url, **kwargs)
+
+def set_sqlite_read_pragmas(dbapi_connection, connection_record):
+    """Read-only connections: the read half of the profile, plus query_only"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def create_read_engine(url: str, **kwargs):
+    """Create an engine that refuses writes, for serving GET traffic"""
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+        db_engine = create_engine(url, **kwargs)
+        event.listen(db_engine, "connect", set_sqlite_read_pragmas)
+        return db_engine
+
+    if url.startswith("postgresql"):
+        options = _postgres_options()
+        options["connect_args"] = {"options": (
+            f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS} -c default_transaction_read_only=on"
+        )}
+        kwargs = {**options, **kwargs}
+    return create_engine(url, **kwargs)
+
+def create_async_db_engine(url: str = ASYNC_SQLALCHEMY_DATABASE_URL, tuned: bool = True, **kwargs):
+    """Async counterpart of create_db_engine"""
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+        db_engine = create_async_engine(url, **kwargs)
+        if tuned:
+            event.listen(db_engine.sync_engine, "connect", set_sqlite_pragmas)
+        return db_engine
+
+    if url.startswith("postgresql") and tuned:
+        options = _postgres_options()
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        kwargs = {**options, **kwargs}
+    return create_async_engine(url, **kwargs)
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engines = [create_read_engine(url) for url in DATABASE_READ_URLS]
+# Only SQLite readers share the primary's file; replicas may lag behind it
+ReadSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=read_engine, info={"may_lag": not url.startswith("sqlite")})
+    for url, read_engine in zip(DATABASE_READ_URLS, read_engines)
+]
+_read_sessions = itertools.cycle(ReadSessionLocals)
+
+# Only built in async mode, so sync deployments need no async driver
+async_engine = create_async_db_engine() if USE_ASYNC_DB else None
+
+# expire_on_commit=False: attribute access after commit must not trigger implicit IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
+# Connections opened per pool at startup, at most the pool's size
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", str(DB_POOL_SIZE)))
+
+def warm_up(db_engine, connections: int = DB_WARMUP_CONNECTIONS) -> int:
+    """Fill the pool up front, so early requests skip connect and PRAGMA setup"""
+    size = db_engine.pool.size() if hasattr(db_engine.pool, "size") else 1
+    opened = [db_engine.connect() for _ in range(max(1, min(connections, size)))]
+    for conn in opened:
+        conn.exec_driver_sql("SELECT 1")
+        conn.close()
+    return len(opened)
+
+async def warm_up_async(db_engine, connections: int = DB_WARMUP_CONNECTIONS) -> int:
+    size = db_engine.pool.size() if hasattr(db_engine.pool, "size") else 1
+    opened = [await db_engine.connect() for _ in range(max(1, min(connections, size)))]
+    for conn in opened:
+        await conn.exec_driver_sql("SELECT 1")
+        await conn.close()
+    return len(opened)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def lock_for_write(db) -> None:
+    """
+    Take the write lock now, before reading rows that a write will be based on
+
+    PostgreSQL locks the rows read with SELECT ... FOR UPDATE. SQLite compiles
+    FOR UPDATE away, and pysqlite only begins a transaction at the first write,
+    so a read before it holds no lock at all; BEGIN IMMEDIATE takes the
+    database write lock up front instead. Takes a sync Session; for an
+    AsyncSession, use await db.run_sync(lock_for_write).
+    """
+    conn = db.connection()
+    if conn.dialect.name == "sqlite" and not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+# Read-your-writes: client -> time of its last write, oldest first
+MAX_TRACKED_WRITERS = 100000
+_recent_writes: "OrderedDict[str, float]" = OrderedDict()
+_recent_writes_lock = threading.Lock()
+
+async def track_writes(request: Request):
+    """
+    App-wide dependency that remembers which clients just wrote
+
+    Use with scope="function": the write is stamped when the handler is done,
+    after its commit and before the response, so READ_YOUR_WRITES_WINDOW
+    starts when the write becomes visible however long it took.
+    """
+    if not ReadSessionLocals or request.method in ("GET", "HEAD", "OPTIONS"):
+        yield
+        return
+    try:
+        yield
+    finally:
+        client = client_id(request.scope)
+        with _recent_writes_lock:
+            _recent_writes[client] = time.monotonic()
+            _recent_writes.move_to_end(client)
+            if len(_recent_writes) > MAX_TRACKED_WRITERS:
+                _recent_writes.popitem(last=False)
+
+def wrote_recently(client: str) -> bool:
+    written = _recent_writes.get(client)
+    return written is not None and time.monotonic() - written < READ_YOUR_WRITES_WINDOW
+
+# Dependency for GET routes: a replica session, or the primary one when there
+# are no replicas or the client wrote within READ_YOUR_WRITES_WINDOW
+def get_read_db(request: Request, db=Depends(get_db)):
+    if not ReadSessionLocals or wrote_recently(client_id(request.scope)):
+        yield db
+        return
+    read_db = next(_read_sessions)()
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,181 @@
+# app/export.py
+"""
+Bulk export of orders to CSV or Parquet, served by GET /orders/export and
+available from the command line:
+
+    python -m app.export --format csv --output orders.csv
+    python -m app.export --format parquet --output week.parquet \\
+        --from 2024-06-03 --to 2024-06-10 --with-email
+
+Rows are read in id order from a server-side cursor (stream_results) in
+chunks of EXPORT_CHUNK_SIZE, and each chunk is encoded and written out before
+the next one is fetched: a CSV block, or a Parquet row group. Memory use
+depends on the chunk size, not on the size of the table. The date range is
+[from, to) on order_date, so consecutive weekly exports neither overlap nor
+miss rows.
+
+Parquet needs pyarrow (pip install pyarrow); CSV has no extra dependencies.
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: pip install pyarrow
+    pyarrow = None
+
+from . import models, serialization
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+def columns(with_email: bool = False) -> Tuple[str, ...]:
+    return serialization.ORDER_COLUMNS + (("user_email",) if with_email else ())
+
+def export_query(
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    with_email: bool = False
+):
+    stmt = select(*(getattr(models.Order, name) for name in serialization.ORDER_COLUMNS))
+    if with_email:
+        stmt = stmt.add_columns(models.User.email.label("user_email")).outerjoin(
+            models.User, models.User.id == models.Order.user_id
+        )
+    if order_date_from is not None:
+        stmt = stmt.where(models.Order.order_date >= order_date_from)
+    if order_date_to is not None:
+        stmt = stmt.where(models.Order.order_date < order_date_to)
+    return stmt.order_by(models.Order.id)
+
+def iter_chunks(db_engine: Engine, stmt, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """Rows of stmt, chunk_size at a time, from a server-side cursor on its own connection"""
+    with db_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for partition in result.partitions():
+            yield partition
+
+def csv_stream(chunks: Iterator[list], names: Tuple[str, ...]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for chunk in chunks:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in chunk
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+def _parquet_schema(names: Tuple[str, ...]):
+    types = {
+        "id": pyarrow.int64(),
+        "user_id": pyarrow.int64(),
+        "product_name": pyarrow.string(),
+        "quantity": pyarrow.int64(),
+        "order_date": pyarrow.timestamp("us"),
+        "user_email": pyarrow.string(),
+    }
+    return pyarrow.schema([(name, types[name]) for name in names])
+
+def parquet_stream(chunks: Iterator[list], names: Tuple[str, ...]) -> Iterator[bytes]:
+    """One row group per chunk, yielded as soon as it is encoded"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = _parquet_schema(names)
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for chunk in chunks:
+            table = pyarrow.Table.from_pylist([dict(zip(names, row)) for row in chunk], schema=schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    # The footer is written on close
+    yield sink.drain()
+
+def stream(
+    db_engine: Engine,
+    fmt: str = "csv",
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    with_email: bool = False,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    names = columns(with_email)
+    chunks = iter_chunks(db_engine, export_query(order_date_from, order_date_to, with_email), chunk_size)
+    return csv_stream(chunks, names) if fmt == "csv" else parquet_stream(chunks, names)
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.export", description="Export orders to CSV or Parquet")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", default="-", help="File to write, or - for stdout")
+    parser.add_argument("--from", dest="order_date_from", type=datetime.fromisoformat,
+                        help="Earliest order_date, inclusive (ISO date or datetime)")
+    parser.add_argument("--to", dest="order_date_to", type=datetime.fromisoformat,
+                        help="Latest order_date, exclusive")
+    parser.add_argument("--with-email", action="store_true", help="Add the ordering user's email")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and pyarrow is None:
+        print("Parquet export requires pyarrow (pip install pyarrow)", file=sys.stderr)
+        return 2
+
+    from .database import engine
+
+    parts = stream(
+        engine, args.format, args.order_date_from, args.order_date_to, args.with_email, args.chunk_size
+    )
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for part in parts:
+            output.write(part)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,59 @@
+# app/fieldsets.py
+from typing import Optional, Set
+
+from fastapi import HTTPException
+
+from . import schemas, serialization
+
+# Sparse fieldsets for user reads: ?fields=id,name picks the scalar fields to
+# return and ?include=orders embeds the orders relationship on top of them.
+# Without ?fields the full schemas.User payload (orders included) is returned.
+USER_FIELDS = tuple(schemas.User.model_fields)
+USER_RELATIONSHIPS = ("orders",)
+
+def _split(value: Optional[str]) -> Set[str]:
+    if not value:
+        return set()
+    return {part.strip() for part in value.split(",") if part.strip()}
+
+def parse_user_fields(fields: Optional[str], include: Optional[str]) -> Optional[Set[str]]:
+    """Return the requested user fields, or None for the full payload"""
+    relationships = _split(include)
+    unknown = relationships - set(USER_RELATIONSHIPS)
+    selected = _split(fields)
+    if fields is not None:
+        if not selected:
+            raise HTTPException(status_code=400, detail="fields must name at least one field")
+        unknown |= selected - set(USER_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(sorted(unknown))}"
+        )
+    # The full payload already embeds every relationship
+    return None if fields is None else selected | relationships
+
+def wants_orders(selected: Optional[Set[str]]) -> bool:
+    return selected is None or "orders" in selected
+
+def user_to_dict(db_user, selected: Optional[Set[str]]) -> dict:
+    """Serialize a user without touching relationships that were not requested"""
+    if selected is None:
+        return serialization.user_to_dict(db_user)
+
+    data = {
+        field: getattr(db_user, field)
+        for field in USER_FIELDS
+        if field in selected and field != "orders"
+    }
+    if "orders" in selected:
+        data["orders"] = [serialization.order_to_dict(o) for o in db_user.orders]
+    return data
+
+def user_response(db_user, selected: Optional[Set[str]], status_code: int = 200):
+    # A partial payload does not satisfy response_model, so it is never checked against it
+    if selected is None:
+        return serialization.json_response(
+            serialization.user_to_dict(db_user), status_code, serialization.USER
+        )
+    return serialization.json_response(user_to_dict(db_user, selected), status_code)
@@ -0,0 +1,185 @@
+# app/idempotency.py
+"""
+Idempotency keys for the create endpoints.
+
+Clients that retry POST /users/ or POST /orders/ after a timeout cannot tell
+whether the first attempt went through. Sending the same Idempotency-Key header
+on every attempt makes the retries safe: the first response is kept for
+IDEMPOTENCY_TTL seconds and later requests with that key get it back, marked
+with Idempotent-Replayed: true, without reaching a handler or the database.
+A duplicate that arrives while the first request is still running waits for
+it instead of writing a second time.
+
+Keys are scoped per client (see ratelimit.client_id) and tied to the request
+they were first used with: reusing one for a different method, path, query or
+body is answered with 422. Server errors are not kept, so a request that failed
+with a 5xx can be retried under the same key.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from . import metrics
+from .ratelimit import client_id
+
+IDEMPOTENCY_PATHS = tuple(
+    path for path in os.getenv("IDEMPOTENCY_PATHS", "/users/,/orders/,/users/bulk,/orders/bulk").split(",") if path
+)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+# How long a duplicate waits for the request it duplicates before giving up with 409
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT_MS", "30000")) / 1000
+MAX_KEY_LENGTH = 255
+
+REPLAYED = metrics.registry.register(metrics.Counter(
+    "http_idempotent_replays_total", "Responses replayed for a repeated Idempotency-Key"
+))
+
+class IdempotencyStore:
+    """Bounded LRU of finished responses, each expiring `ttl` seconds after it was stored"""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_size: int = IDEMPOTENCY_MAX_KEYS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: tuple, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+store = IdempotencyStore()
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware, so a replay is answered before routing and the threadpool"""
+
+    def __init__(
+        self,
+        app,
+        paths: Tuple[str, ...] = IDEMPOTENCY_PATHS,
+        store: IdempotencyStore = store,
+        wait_timeout: float = IDEMPOTENCY_WAIT_TIMEOUT,
+    ):
+        self.app = app
+        self.paths = paths
+        self.store = store
+        self.wait_timeout = wait_timeout
+        # key -> (fingerprint, event set when the first request finishes)
+        self._in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope["headers"]).get(b"idempotency-key")
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not header or len(header) > MAX_KEY_LENGTH:
+            await _send(send, _error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"))
+            return
+
+        # The body is read up front for the fingerprint and handed on unchanged
+        messages, body = [], b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        fingerprint = hashlib.sha256(
+            b"\n".join((scope["method"].encode(), scope["path"].encode(), scope["query_string"], body))
+        ).hexdigest()
+        key = (client_id(scope), header.decode("latin-1"))
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            entry = self.store.get(key)
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    await _send(send, _MISMATCH)
+                    return
+                REPLAYED.inc()
+                await _send(send, entry, replayed=True)
+                return
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            if in_flight[0] != fingerprint:
+                await _send(send, _MISMATCH)
+                return
+            # Wait for the first request, then look again: it may have failed
+            try:
+                await asyncio.wait_for(in_flight[1].wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                await _send(send, _error(409, "A request with this Idempotency-Key is still in progress"))
+                return
+
+        done = asyncio.Event()
+        self._in_flight[key] = (fingerprint, done)
+        response = {"status": 500, "headers": [], "body": b"", "fingerprint": fingerprint}
+
+        async def replay_receive():
+            return messages.pop(0) if messages else await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            if response["status"] < 500:
+                self.store.set(key, response)
+        finally:
+            del self._in_flight[key]
+            done.set()
+
+def _error(status_code: int, detail: str) -> dict:
+    return {
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json")],
+        "body": ('{"detail":"' + detail + '"}').encode(),
+    }
+
+_MISMATCH = _error(422, "Idempotency-Key was already used for a different request")
+
+async def _send(send, entry: dict, replayed: bool = False) -> None:
+    headers = [(name, value) for name, value in entry["headers"] if name.lower() != b"content-length"]
+    headers.append((b"content-length", str(len(entry["body"])).encode()))
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": entry["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": entry["body"]})
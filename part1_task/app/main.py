@@ -1,17 +1,58 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Body, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select, insert, update, delete, tuple_
+from sqlalchemy.orm import Session, aliased, selectinload
 from sqlalchemy.exc import IntegrityError
-from typing import List
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+import os
+import time
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
 
-from .database import get_db, engine
-from . import models, schemas
+from .database import get_db, get_read_db, track_writes, lock_for_write, engine, async_engine, read_engines, warm_up, warm_up_async, USE_ASYNC_DB, DELETE_CHUNK_SIZE, DELETE_CHUNK_PAUSE
+from . import models, schemas, fieldsets, batching, cache, export, idempotency, metrics, migrations, profiling, ratelimit, search, serialization, stats, async_routes
+
+# Create tables and run migrations at startup. app.server does this once before
+# starting its workers and sets SCHEMA_SETUP=false for them, so workers neither
+# repeat it nor race each other on the schema.
+SCHEMA_SETUP = os.getenv("SCHEMA_SETUP", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SCHEMA_SETUP:
+        await run_in_threadpool(migrations.setup, engine)
+    for db_engine in [engine, *read_engines]:
+        await run_in_threadpool(warm_up, db_engine)
+    if async_engine is not None:
+        await warm_up_async(async_engine)
+    yield
+    if batching.order_batcher is not None:
+        await run_in_threadpool(batching.order_batcher.close)
+    if async_engine is not None:
+        await async_engine.dispose()
+    for db_engine in [engine, *read_engines]:
+        db_engine.dispose()
 
 # Create the app
-app = FastAPI()
+# track_writes keeps a client's reads on the primary right after it writes
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(track_writes, scope="function")])
+app.router.route_class = profiling.ProfiledRoute
+# Added last, so metrics is outermost and also records rejected requests;
+# idempotent replays still count against the client's limits
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_middleware(ratelimit.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+for db_engine in [engine, *read_engines]:
+    metrics.instrument_engine(db_engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+# Threadpool-backed CRUD routes; the AsyncSession variants live in async_routes.py
+router = APIRouter(route_class=profiling.ProfiledRoute)
 
 @app.get("/")
 def read_root():
@@ -25,14 +66,18 @@ def read_root():
         }
     }
 
-@app.post("/users/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
+@router.post("/users/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     try:
-        db_user = models.User(name=user.name, email=user.email)
+        # A new user has no orders; initializing the collection avoids a lazy load
+        db_user = models.User(name=user.name, email=user.email, orders=[])
         db.add(db_user)
+        db.flush()
+        response = serialization.json_response(
+            serialization.user_to_dict(db_user), status.HTTP_201_CREATED, serialization.USER
+        )
         db.commit()
-        db.refresh(db_user)
-        return db_user
+        return response
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -40,82 +85,671 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             detail="Email already registered"
         )
 
-@app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+@router.get("/users/{user_id}", response_model=schemas.User)
+def read_user(
+    request: Request,
+    user_id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    selected = fieldsets.parse_user_fields(fields, include)
+    # Only the full payload is cached; sparse reads are cheap to build anyway
+    if selected is None:
+        entry = cache.lookup(cache.user_key(user_id))
+        if entry is not None:
+            return cache.entry_response(request, entry)
+    since = cache.generation()
+
+    stmt = select(models.User).where(models.User.id == user_id)
+    if fieldsets.wants_orders(selected):
+        stmt = stmt.options(selectinload(models.User.orders))
+
+    db_user = db.scalars(stmt).first()
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    if selected is None:
+        # A lagging replica could put a stale row back after a write invalidated it
+        entry = cache.store(
+            cache.user_key(user_id), fieldsets.user_to_dict(db_user, None),
+            save=not db.info.get("may_lag"), since=since
+        )
+        return cache.entry_response(request, entry)
+    return fieldsets.user_response(db_user, selected)
 
-@app.put("/users/{user_id}", response_model=schemas.User)
+@router.put("/users/{user_id}", response_model=schemas.User)
 def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+    update_data = user.model_dump(exclude_unset=True)
+    if update_data:
+        stmt = (
+            update(models.User)
+            .where(models.User.id == user_id)
+            .values(**update_data)
+            .returning(models.User)
+        )
+    else:
+        stmt = select(models.User).where(models.User.id == user_id)
+
     try:
-        update_data = user.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_user, key, value)
-        
-        db.commit()
-        db.refresh(db_user)
-        return db_user
+        db_user = db.scalars(stmt).first()
     except IntegrityError:
         db.rollback()
         raise HTTPException(
             status_code=400,
             detail="Email already exists"
         )
-
-@app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    db.delete(db_user)
+
+    # The payload embeds the user's orders (one read); serialize before commit expires them
+    response = serialization.json_response(
+        serialization.user_to_dict(db_user), adapter=serialization.USER
+    )
     db.commit()
+    cache.invalidate_user(user_id)
+    return response
+
+# What stats.apply() needs from an order row
+ORDER_STATS_COLUMNS = (
+    models.Order.user_id, models.Order.product_name, models.Order.quantity, models.Order.order_date
+)
+
+# Background deletes remove a large account's orders in short transactions so
+# other writers can take the write lock between chunks
+def _purge_user(bind, user_id: int) -> None:
+    while True:
+        with Session(bind=bind) as db:
+            # Holding the user row keeps orders from being added until commit
+            lock_for_write(db)
+            db.execute(select(models.User.id).where(models.User.id == user_id).with_for_update())
+            chunk = (
+                select(models.Order.id)
+                .where(models.Order.user_id == user_id)
+                .limit(DELETE_CHUNK_SIZE)
+            )
+            deleted = db.execute(
+                delete(models.Order)
+                .where(models.Order.id.in_(chunk))
+                .returning(*ORDER_STATS_COLUMNS)
+                .execution_options(synchronize_session=False)
+            ).all()
+            stats.apply(db, removed=deleted)
+            last = len(deleted) < DELETE_CHUNK_SIZE
+            if last:
+                # In the same transaction as the last chunk: the cascade then
+                # has no orders left to remove behind the aggregates' back
+                db.execute(delete(models.User).where(models.User.id == user_id))
+            db.commit()
+        cache.invalidate_user(user_id, orders=last)
+        if last:
+            break
+        time.sleep(DELETE_CHUNK_PAUSE)
+
+@router.delete(
+    "/users/{user_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"description": "Deletion scheduled in the background"}}
+)
+def delete_user(
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    db: Session = Depends(get_db)
+):
+    if background:
+        if db.get(models.User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        background_tasks.add_task(_purge_user, db.get_bind(), user_id)
+        return Response(status_code=status.HTTP_202_ACCEPTED)
+
+    # Holding the user row keeps orders from being added between the totals
+    # update and the DELETE, where the cascade would remove them uncounted
+    lock_for_write(db)
+    if db.scalar(select(models.User.id).where(models.User.id == user_id).with_for_update()) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # ON DELETE CASCADE removes the orders (and their daily stats) inside the
+    # DELETE; only the product totals need adjusting first
+    db.execute(stats.remove_user_orders(user_id))
+    db.execute(delete(models.User).where(models.User.id == user_id))
+    db.commit()
+    cache.invalidate_user(user_id, orders=True)
     return None
 
-@app.post("/orders/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
+def _is_foreign_key_violation(exc: IntegrityError) -> bool:
+    return "foreign key" in str(exc.orig).lower()
+
+@router.post("/orders/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
 def create_order(order: schemas.OrderCreate, user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    db_order = models.Order(**order.model_dump(), user_id=user_id)
-    db.add(db_order)
+    if batching.order_batcher is not None:
+        return _create_order_batched(order, user_id)
+
+    # The foreign key rejects unknown users, so no existence check is needed
+    try:
+        db_order = db.scalars(
+            insert(models.Order)
+            .values(**order.model_dump(), user_id=user_id)
+            .returning(models.Order)
+        ).one()
+    except IntegrityError as e:
+        db.rollback()
+        if _is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise
+
+    stats.apply(db, added=[db_order])
+    response = serialization.json_response(
+        serialization.order_to_dict(db_order), status.HTTP_201_CREATED, serialization.ORDER
+    )
     db.commit()
-    db.refresh(db_order)
-    return db_order
+    cache.invalidate_user(user_id)
+    return response
 
-@app.get("/orders/{order_id}", response_model=schemas.Order)
-def read_order(order_id: int, db: Session = Depends(get_db)):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if db_order is None:
-        raise HTTPException(status_code=404, detail="Order not found")
-    return db_order
+def _create_order_batched(order: schemas.OrderCreate, user_id: int):
+    # Blocks this worker thread until the group commit that includes the row
+    try:
+        row = batching.order_batcher.submit({**order.model_dump(), "user_id": user_id}).result()
+    except IntegrityError as e:
+        if _is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise
+
+    cache.invalidate_user(user_id)
+    return serialization.json_response(row, status.HTTP_201_CREATED, serialization.ORDER)
+
+@router.get("/orders/{order_id}", response_model=schemas.Order)
+def read_order(request: Request, order_id: int, db: Session = Depends(get_read_db)):
+    entry = cache.lookup(cache.order_key(order_id))
+    if entry is not None:
+        return cache.entry_response(request, entry)
+    since = cache.generation()
 
-@app.put("/orders/{order_id}", response_model=schemas.Order)
-def update_order(order_id: int, order: schemas.OrderCreate, db: Session = Depends(get_db)):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    for key, value in order.model_dump().items():
-        setattr(db_order, key, value)
-    
+    entry = cache.store(
+        cache.order_key(order_id),
+        serialization.order_to_dict(db_order),
+        tags=[cache.user_orders_tag(db_order.user_id)],
+        save=not db.info.get("may_lag"),
+        since=since
+    )
+    return cache.entry_response(request, entry)
+
+def _update_order(db: Session, order_id: int, values: dict) -> Response:
+    if values:
+        # The aggregates move from the old values to the new ones, so a
+        # concurrent writer must not change the row in between
+        lock_for_write(db)
+        old = db.execute(
+            select(*ORDER_STATS_COLUMNS).where(models.Order.id == order_id).with_for_update()
+        ).first()
+        if old is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        db_order = db.scalars(
+            update(models.Order)
+            .where(models.Order.id == order_id)
+            .values(**values)
+            .returning(models.Order)
+        ).one()
+        stats.apply(db, removed=[old], added=[db_order])
+    else:
+        db_order = db.scalars(select(models.Order).where(models.Order.id == order_id)).first()
+        if db_order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+    user_id = db_order.user_id
+    response = serialization.json_response(
+        serialization.order_to_dict(db_order), adapter=serialization.ORDER
+    )
     db.commit()
-    db.refresh(db_order)
-    return db_order
+    cache.invalidate_order(order_id, user_id)
+    return response
+
+@router.put("/orders/{order_id}", response_model=schemas.Order)
+def update_order(order_id: int, order: schemas.OrderCreate, db: Session = Depends(get_db)):
+    return _update_order(db, order_id, order.model_dump())
 
-@app.delete("/orders/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.patch("/orders/{order_id}", response_model=schemas.Order)
+def patch_order(order_id: int, order: schemas.OrderUpdate, db: Session = Depends(get_db)):
+    return _update_order(db, order_id, order.model_dump(exclude_unset=True))
+
+@router.delete("/orders/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_order(order_id: int, db: Session = Depends(get_db)):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if db_order is None:
+    deleted = db.execute(
+        delete(models.Order)
+        .where(models.Order.id == order_id)
+        .returning(*ORDER_STATS_COLUMNS)
+    ).first()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    db.delete(db_order)
+
+    stats.apply(db, removed=[deleted])
     db.commit()
-    return None
\ No newline at end of file
+    cache.invalidate_order(order_id, deleted.user_id)
+    return None
+
+# List endpoints: keyset pagination on id, or NDJSON streaming when the client
+# sends "Accept: application/x-ndjson"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# ids are Integer columns, 32-bit on PostgreSQL; larger values cannot be bound
+MAX_ID = 2 ** 31 - 1
+STREAM_BATCH_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def _wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def _page(db: Session, stmt, limit: int):
+    # Fetch one extra row to learn whether another page exists
+    rows = db.scalars(stmt.limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _paginate(db: Session, stmt, limit: int, to_dict, adapter=None) -> Response:
+    rows, next_cursor = _page(db, stmt, limit)
+    return serialization.json_response(
+        {"items": [to_dict(row) for row in rows], "next_cursor": next_cursor},
+        adapter=adapter
+    )
+
+def _parse_ids(ids: str) -> List[int]:
+    """Comma-separated ids, duplicates dropped, in the order given"""
+    try:
+        parsed = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if any(abs(id_) > MAX_ID for id_ in parsed):
+        raise HTTPException(status_code=400, detail=f"ids must be between -{MAX_ID} and {MAX_ID}")
+    if len(parsed) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+    return parsed
+
+def _by_ids(db: Session, stmt, model, ids: str, to_dict, adapter=None) -> Response:
+    # One IN query per chunk instead of one request and SELECT per id; rows
+    # come back in the requested order and absent ids are listed as missing
+    wanted = _parse_ids(ids)
+    found = {}
+    for chunk in _chunked(wanted, IN_CLAUSE_CHUNK_SIZE):
+        found.update((row.id, row) for row in db.scalars(stmt.where(model.id.in_(chunk))))
+    return serialization.json_response({
+        "items": [to_dict(found[id_]) for id_ in wanted if id_ in found],
+        "next_cursor": None,
+        "missing": [id_ for id_ in wanted if id_ not in found],
+    }, adapter=adapter)
+
+def _stream_ndjson(db: Session, stmt, to_dict) -> StreamingResponse:
+    # yield_per fetches from a server-side cursor in batches, so the full
+    # result is never held in memory or serialized as one JSON array
+    def rows():
+        for row in db.scalars(stmt.execution_options(yield_per=STREAM_BATCH_SIZE)):
+            yield serialization.dumps(to_dict(row)) + b"\n"
+    return StreamingResponse(rows(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/users/", response_model=schemas.UserPage)
+def list_users(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    ids: Optional[str] = Query(None, description="Comma-separated ids to fetch in one call"),
+    db: Session = Depends(get_read_db)
+):
+    selected = fieldsets.parse_user_fields(fields, include)
+    stmt = select(models.User).order_by(models.User.id)
+    # One extra IN query per page (or stream batch) instead of one per user
+    if fieldsets.wants_orders(selected):
+        stmt = stmt.options(selectinload(models.User.orders))
+    if after_id is not None:
+        stmt = stmt.where(models.User.id > after_id)
+
+    def to_dict(row):
+        return fieldsets.user_to_dict(row, selected)
+
+    # Sparse pages do not satisfy UserPage, so only full pages are checked
+    adapter = serialization.USER_PAGE if selected is None else None
+    if ids is not None:
+        return _by_ids(db, stmt, models.User, ids, to_dict, adapter)
+
+    if _wants_ndjson(request):
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return _stream_ndjson(db, stmt, to_dict)
+    return _paginate(db, stmt, limit or DEFAULT_PAGE_SIZE, to_dict, adapter)
+
+@app.get("/orders/", response_model=schemas.OrderPage)
+def list_orders(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    user_id: Optional[int] = None,
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    ids: Optional[str] = Query(None, description="Comma-separated ids to fetch in one call"),
+    db: Session = Depends(get_read_db)
+):
+    stmt = select(models.Order).order_by(models.Order.id)
+    if after_id is not None:
+        stmt = stmt.where(models.Order.id > after_id)
+    if user_id is not None:
+        stmt = stmt.where(models.Order.user_id == user_id)
+    if order_date_from is not None:
+        stmt = stmt.where(models.Order.order_date >= order_date_from)
+    if order_date_to is not None:
+        stmt = stmt.where(models.Order.order_date < order_date_to)
+
+    if ids is not None:
+        return _by_ids(db, stmt, models.Order, ids, serialization.order_to_dict, serialization.ORDER_PAGE)
+
+    if _wants_ndjson(request):
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return _stream_ndjson(db, stmt, serialization.order_to_dict)
+    return _paginate(
+        db, stmt, limit or DEFAULT_PAGE_SIZE, serialization.order_to_dict, serialization.ORDER_PAGE
+    )
+
+# Registered on the app, ahead of GET /orders/{order_id} on the router
+@app.get(
+    "/orders/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type, _ in export.FORMATS.values()}}}
+)
+def export_orders(
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    include_email: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    """Every order in the date range as one CSV or Parquet file, streamed in chunks"""
+    if format == "parquet" and export.pyarrow is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    media_type, extension = export.FORMATS[format]
+    return StreamingResponse(
+        export.stream(db.get_bind(), format, order_date_from, order_date_to, include_email),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{extension}"'}
+    )
+
+@app.get("/users/{user_id}/orders", response_model=schemas.OrderPage)
+def list_user_orders(
+    user_id: int,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    """A user's orders, newest first, read in ix_orders_user_id_order_date order"""
+    stmt = (
+        select(models.Order)
+        .where(models.Order.user_id == user_id)
+        .order_by(models.Order.order_date.desc(), models.Order.id.desc())
+    )
+    if after_id is not None:
+        # Compare against the cursor row's stored values, so timestamps never
+        # round-trip through a bind parameter
+        cursor = aliased(models.Order)
+        stmt = stmt.where(
+            tuple_(models.Order.order_date, models.Order.id) < (
+                select(cursor.order_date, cursor.id)
+                .where(cursor.id == after_id, cursor.user_id == user_id)
+                .scalar_subquery()
+            )
+        )
+    if order_date_from is not None:
+        stmt = stmt.where(models.Order.order_date >= order_date_from)
+    if order_date_to is not None:
+        stmt = stmt.where(models.Order.order_date < order_date_to)
+
+    rows, next_cursor = _page(db, stmt, limit or DEFAULT_PAGE_SIZE)
+    # Only an empty page needs telling apart from a missing user, or from a
+    # cursor that matched no row of this user's and so compared as NULL
+    if not rows:
+        if db.get(models.User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        if after_id is not None and db.scalar(
+            select(models.Order.id).where(models.Order.id == after_id, models.Order.user_id == user_id)
+        ) is None:
+            raise HTTPException(status_code=400, detail="after_id is not one of this user's orders")
+    return serialization.json_response(
+        {"items": [serialization.order_to_dict(row) for row in rows], "next_cursor": next_cursor},
+        adapter=serialization.ORDER_PAGE
+    )
+
+# Bulk creates: every row is validated on its own so one bad row is reported
+# instead of rejecting the batch, and the valid rows go in as multi-row
+# INSERT ... RETURNING statements inside a single transaction. Asking for
+# sort_by_parameter_order would make SQLite fall back to one INSERT per row.
+BULK_MAX_ROWS = 10000
+IN_CLAUSE_CHUNK_SIZE = 500
+
+def _chunked(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _validation_detail(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+def _validate_rows(rows: List[Dict[str, Any]], schema, errors: list) -> list:
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BULK_MAX_ROWS} rows per request"
+        )
+
+    valid = []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.model_validate(row)))
+        except ValidationError as e:
+            errors.append({"index": index, "detail": _validation_detail(e)})
+    return valid
+
+def _existing(db: Session, column, values: list) -> set:
+    found = set()
+    for chunk in _chunked(list(values), IN_CLAUSE_CHUNK_SIZE):
+        found.update(db.scalars(select(column).where(column.in_(chunk))))
+    return found
+
+@app.post("/users/bulk", response_model=schemas.UserBulkResult, status_code=status.HTTP_201_CREATED)
+def bulk_create_users(users: List[Dict[str, Any]] = Body(...), db: Session = Depends(get_db)):
+    errors = []
+    valid = _validate_rows(users, schemas.UserCreate, errors)
+
+    taken = _existing(db, models.User.email, {user.email for _, user in valid})
+    rows = []
+    for index, user in valid:
+        if user.email in taken:
+            errors.append({"index": index, "detail": "Email already registered"})
+            continue
+        taken.add(user.email)
+        rows.append(user.model_dump())
+
+    created = []
+    if rows:
+        try:
+            result = db.execute(
+                insert(models.User).returning(
+                    models.User.id, models.User.name, models.User.email,
+                    models.User.created_at
+                ),
+                rows
+            )
+            # RETURNING order is not guaranteed, so match rows back by email
+            by_email = {row.email: dict(row._mapping) for row in result}
+            created = [{**by_email[row["email"]], "orders": []} for row in rows]
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="Email registered concurrently, retry the batch"
+            )
+
+    errors.sort(key=lambda error: error["index"])
+    return serialization.json_response(
+        {"created": created, "errors": errors}, status.HTTP_201_CREATED, serialization.USER_BULK_RESULT
+    )
+
+@app.post("/orders/bulk", response_model=schemas.OrderBulkResult, status_code=status.HTTP_201_CREATED)
+def bulk_create_orders(orders: List[Dict[str, Any]] = Body(...), db: Session = Depends(get_db)):
+    errors = []
+    valid = _validate_rows(orders, schemas.OrderBulkCreate, errors)
+
+    known_users = _existing(db, models.User.id, {order.user_id for _, order in valid})
+    rows = []
+    for index, order in valid:
+        if order.user_id not in known_users:
+            errors.append({"index": index, "detail": "User not found"})
+            continue
+        rows.append(order.model_dump())
+
+    created = []
+    if rows:
+        try:
+            result = db.execute(
+                insert(models.Order).returning(
+                    models.Order.id, models.Order.user_id, models.Order.product_name,
+                    models.Order.quantity, models.Order.order_date
+                ),
+                rows
+            ).all()
+            stats.apply(db, added=result)
+            # Ids are assigned in VALUES order, so sorting restores payload order
+            created = sorted((dict(row._mapping) for row in result), key=lambda row: row["id"])
+            db.commit()
+            for user_id in {row["user_id"] for row in rows}:
+                cache.invalidate_user(user_id)
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="User deleted concurrently, retry the batch"
+            )
+
+    errors.sort(key=lambda error: error["index"])
+    return serialization.json_response(
+        {"created": created, "errors": errors}, status.HTTP_201_CREATED, serialization.ORDER_BULK_RESULT
+    )
+
+@app.get("/stats/products", response_model=List[schemas.ProductStats])
+def read_product_stats(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """Products by total quantity ordered, read from the maintained aggregates"""
+    rows = db.execute(
+        select(stats.ProductStats)
+        .where(stats.ProductStats.c.order_count > 0)
+        .order_by(stats.ProductStats.c.total_quantity.desc(), stats.ProductStats.c.product_name)
+        .limit(limit)
+    )
+    return serialization.json_response(
+        [dict(row._mapping) for row in rows], adapter=serialization.PRODUCT_STATS_LIST
+    )
+
+@app.get("/users/{user_id}/stats", response_model=schemas.UserStats)
+def read_user_stats(
+    user_id: int,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Orders per day for one user, plus totals over the selected days"""
+    table = stats.UserDailyStats
+    stmt = (
+        select(table.c.day, table.c.order_count, table.c.total_quantity)
+        .where(table.c.user_id == user_id, table.c.order_count > 0)
+        .order_by(table.c.day)
+    )
+    if day_from is not None:
+        stmt = stmt.where(table.c.day >= day_from)
+    if day_to is not None:
+        stmt = stmt.where(table.c.day < day_to)
+    days = [dict(row._mapping) for row in db.execute(stmt)]
+
+    if not days and db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return serialization.json_response({
+        "user_id": user_id,
+        "order_count": sum(day["order_count"] for day in days),
+        "total_quantity": sum(day["total_quantity"] for day in days),
+        "days": days,
+    }, adapter=serialization.USER_STATS)
+
+def _search_page(db: Session, stmt, offset: int, limit: int, to_dict, adapter=None) -> Response:
+    # Ranked results have no stable key to resume from, so the cursor is an offset
+    rows = db.scalars(stmt.offset(offset).limit(limit + 1)).all()
+    next_cursor = offset + limit if len(rows) > limit else None
+    return serialization.json_response(
+        {"items": [to_dict(row) for row in rows[:limit]], "next_cursor": next_cursor},
+        adapter=adapter
+    )
+
+@app.get("/search/users", response_model=schemas.UserPage)
+def search_users(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Users whose name or email contains words starting with each term of q, best match first"""
+    selected = fieldsets.parse_user_fields(fields, include)
+    words = search.terms(q)
+    if not words:
+        return serialization.json_response({"items": [], "next_cursor": None})
+    stmt = search.users_query(db.get_bind(), words)
+    if fieldsets.wants_orders(selected):
+        stmt = stmt.options(selectinload(models.User.orders))
+
+    def to_dict(row):
+        return fieldsets.user_to_dict(row, selected)
+
+    adapter = serialization.USER_PAGE if selected is None else None
+    return _search_page(db, stmt, cursor, limit, to_dict, adapter)
+
+@app.get("/search/orders", response_model=schemas.OrderPage)
+def search_orders(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Orders whose product name matches q, best match first"""
+    words = search.terms(q)
+    if not words:
+        return serialization.json_response({"items": [], "next_cursor": None})
+    stmt = search.orders_query(db.get_bind(), words)
+    if user_id is not None:
+        stmt = stmt.where(models.Order.user_id == user_id)
+    return _search_page(
+        db, stmt, cursor, limit, serialization.order_to_dict, serialization.ORDER_PAGE
+    )
+
+@app.get("/cache/stats")
+def read_cache_stats():
+    return cache.backend.stats()
+
+metrics.registry.register(metrics.CallbackMetric(
+    "cache_hits_total", "Entity cache hits", "counter", lambda: cache.backend.hits
+))
+metrics.registry.register(metrics.CallbackMetric(
+    "cache_misses_total", "Entity cache misses", "counter", lambda: cache.backend.misses
+))
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Serve the CRUD routes from whichever database layer is configured
+app.include_router(async_routes.router if USE_ASYNC_DB else router)
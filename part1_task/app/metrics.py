@@ -0,0 +1,308 @@
+# app/metrics.py
+"""
+Request and SQL metrics exposed in the Prometheus text format.
+
+MetricsMiddleware records per-route latency, in-flight requests and status
+codes. instrument_engine() hooks SQLAlchemy cursor events to count statements
+and time spent in the database for the request being served, and logs slow
+statements together with their query plan.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+EXPLAIN_SLOW_QUERIES = os.getenv("EXPLAIN_SLOW_QUERIES", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._values.get(label_values)
+        return series[-1] if series else 0
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        lines = self.header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+class CallbackMetric(_Metric):
+    """Single-value metric read from a callable at scrape time"""
+
+    def __init__(self, name: str, help_text: str, kind: str, fn: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name} {_format_value(self.fn())}"]
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+))
+IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+REQUEST_DB_STATEMENTS = registry.register(Histogram(
+    "http_request_db_statements", "SQL statements issued per request", ("method", "route"),
+    buckets=STATEMENT_BUCKETS
+))
+REQUEST_DB_TIME = registry.register(Histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per request", ("method", "route")
+))
+DB_STATEMENTS = registry.register(Counter(
+    "db_statements_total", "SQL statements executed", ("operation",)
+))
+DB_TIME = registry.register(Counter(
+    "db_statement_duration_seconds_total", "Time spent executing SQL", ("operation",)
+))
+DB_SLOW_STATEMENTS = registry.register(Counter(
+    "db_slow_statements_total", "SQL statements slower than SLOW_QUERY_MS", ("operation",)
+))
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+# Shared with the threadpool: anyio copies the context into worker threads, and
+# the handler mutates the same RequestStats object the middleware created
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path_format", None) or getattr(route, "path", None)
+    # Unmatched paths are collapsed so scanners cannot blow up label cardinality
+    return path or "unmatched"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed until the last chunk"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            method, route = scope["method"], _route_label(scope)
+            REQUESTS.inc(method, route, str(status_code))
+            REQUEST_LATENCY.observe(elapsed, method, route)
+            REQUEST_DB_STATEMENTS.observe(stats.statements, method, route)
+            REQUEST_DB_TIME.observe(stats.db_seconds, method, route)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            # Background tasks run inside the app call after the last chunk;
+            # they are not part of the request
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            finish()
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    elif dialect == "postgresql":
+        prefix = "EXPLAIN "
+    else:
+        return None
+    # A separate cursor leaves the caller's pending result untouched
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if dialect == "sqlite":
+        return "\n".join(row[-1] for row in rows)
+    return "\n".join(row[0] for row in rows)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    operation = _operation(statement)
+    DB_STATEMENTS.inc(operation)
+    DB_TIME.inc(operation, amount=elapsed)
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    DB_SLOW_STATEMENTS.inc(operation)
+    plan = None
+    if EXPLAIN_SLOW_QUERIES and not executemany and operation in ("SELECT", "UPDATE", "DELETE", "WITH"):
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            plan = f"unavailable: {e}"
+    logger.warning(
+        "Slow query (%.1f ms): %s\nParameters: %r\nQuery plan:\n%s",
+        elapsed * 1000, statement, parameters, plan
+    )
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(db_engine) -> None:
+    """Attach the SQL hooks to a sync engine (use .sync_engine for async ones)"""
+    if event.contains(db_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(db_engine, "handle_error", _handle_error)
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,142 @@
+# app/migrations.py
+"""
+Schema migrations for databases created by older versions of the app.
+
+create_all() only creates missing tables, so changes to existing tables are
+applied here. Every migration checks whether it is still needed, which makes
+them safe to run against fresh databases and on every startup.
+
+    python -m app.migrations
+"""
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import models, search, stats
+
+def _orders_fk_has_cascade(db_engine: Engine) -> bool:
+    for fk in inspect(db_engine).get_foreign_keys("orders"):
+        if fk["referred_table"] == "users":
+            return (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+    return True
+
+def orders_user_fk_on_delete_cascade(db_engine: Engine) -> bool:
+    """Move the users -> orders cascade from the ORM into the schema"""
+    if _orders_fk_has_cascade(db_engine):
+        return False
+
+    if db_engine.dialect.name == "sqlite":
+        _rebuild_sqlite_orders(db_engine)
+        return True
+
+    fk_name = next(
+        fk["name"] for fk in inspect(db_engine).get_foreign_keys("orders")
+        if fk["referred_table"] == "users"
+    )
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql(
+            f'ALTER TABLE orders DROP CONSTRAINT "{fk_name}", '
+            f'ADD CONSTRAINT "{fk_name}" FOREIGN KEY (user_id) '
+            "REFERENCES users (id) ON DELETE CASCADE"
+        )
+    return True
+
+def _rebuild_sqlite_orders(db_engine: Engine) -> None:
+    # SQLite cannot alter a foreign key, so the table is rebuilt and the rows
+    # copied over in one transaction. foreign_keys must be off during the swap
+    # and can only be toggled outside a transaction, hence the raw connection.
+    table = models.Order.__table__
+    dialect = db_engine.dialect
+    old_columns = {col["name"] for col in inspect(db_engine).get_columns("orders")}
+    columns = ", ".join(col.name for col in table.columns if col.name in old_columns)
+    old_indexes = [index["name"] for index in inspect(db_engine).get_indexes("orders")]
+
+    raw = db_engine.raw_connection()
+    try:
+        dbapi_connection = raw.driver_connection
+        previous_isolation = dbapi_connection.isolation_level
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute("ALTER TABLE orders RENAME TO _orders_old")
+            for name in old_indexes:
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+            cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+            for index in table.indexes:
+                cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+            cursor.execute(f"INSERT INTO orders ({columns}) SELECT {columns} FROM _orders_old")
+            cursor.execute("DROP TABLE _orders_old")
+            if cursor.execute("PRAGMA foreign_key_check(orders)").fetchone() is not None:
+                raise RuntimeError("orders contains rows that reference missing users")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+            dbapi_connection.isolation_level = previous_isolation
+    finally:
+        raw.close()
+
+def orders_user_id_order_date_index(db_engine: Engine) -> bool:
+    """Add the composite index behind per-user order lookups"""
+    name = "ix_orders_user_id_order_date"
+    if any(index["name"] == name for index in inspect(db_engine).get_indexes("orders")):
+        return False
+
+    if db_engine.dialect.name == "postgresql":
+        # CONCURRENTLY keeps orders writable while the index builds, but
+        # cannot run inside a transaction
+        with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON orders (user_id, order_date)"
+            )
+        return True
+
+    index = next(index for index in models.Order.__table__.indexes if index.name == name)
+    index.create(bind=db_engine, checkfirst=True)
+    return True
+
+def backfill_order_stats(db_engine: Engine) -> bool:
+    """Fill the aggregate tables for orders written before they existed"""
+    models.Base.metadata.create_all(
+        bind=db_engine,
+        tables=[models.ProductStats.__table__, models.UserDailyStats.__table__]
+    )
+    with db_engine.connect() as conn:
+        has_orders = conn.scalar(select(models.Order.id).limit(1)) is not None
+        has_stats = conn.scalar(select(models.ProductStats.product_name).limit(1)) is not None
+    if not has_orders or has_stats:
+        return False
+    stats.rebuild(db_engine)
+    return True
+
+def search_index(db_engine: Engine) -> bool:
+    """Create and fill the FTS5 search tables, and restore triggers a table rebuild dropped"""
+    with db_engine.begin() as conn:
+        return search.install(conn)
+
+MIGRATIONS = [
+    orders_user_fk_on_delete_cascade,
+    orders_user_id_order_date_index,
+    backfill_order_stats,
+    search_index,
+]
+
+def run_migrations(db_engine: Engine) -> list:
+    """Apply pending migrations and return the names of those that ran"""
+    return [migration.__name__ for migration in MIGRATIONS if migration(db_engine)]
+
+def setup(db_engine: Engine) -> list:
+    """Create missing tables, then apply pending migrations"""
+    models.Base.metadata.create_all(bind=db_engine)
+    return run_migrations(db_engine)
+
+if __name__ == "__main__":
+    from .database import engine
+
+    applied = setup(engine)
+    print("Applied: " + ", ".join(applied) if applied else "Schema is up to date")
@@ -1,10 +1,35 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, CheckConstraint, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from datetime import datetime
 
 from .database import Base
 
+class _SQLiteDateTime(sqlite.DATETIME):
+    """
+    SQLite compares datetimes as text, and CURRENT_TIMESTAMP stores whole
+    seconds without a fraction. Whole-second values are bound in that format,
+    so a range bound equal to a server-stamped value compares equal instead of
+    sorting after it; values with microseconds keep them.
+    """
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        whole = sqlite.DATETIME(truncate_microseconds=True).bind_processor(dialect)
+        fractional = super().bind_processor(dialect)
+
+        def process(value):
+            if isinstance(value, datetime) and not value.microsecond:
+                return whole(value)
+            return fractional(value)
+
+        return process
+
+Timestamp = DateTime(timezone=True).with_variant(_SQLiteDateTime(timezone=True), "sqlite")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -12,19 +37,40 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: ON DELETE CASCADE removes the orders, so the ORM never loads them to delete
+    orders = relationship("Order", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class Order(Base):
     __tablename__ = "orders"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     product_name = Column(String, nullable=False)
     quantity = Column(Integer, nullable=False)
-    order_date = Column(DateTime(timezone=True), server_default=func.now())
+    order_date = Column(Timestamp, server_default=func.now())
     
     __table_args__ = (
         CheckConstraint('quantity > 0', name='quantity_positive'),
+        # Serves lookups by user (including the User.orders load) and per-user
+        # date ranges; existing databases get it from app/migrations.py
+        Index('ix_orders_user_id_order_date', 'user_id', 'order_date'),
     )
     
-    user = relationship("User", back_populates="orders")
\ No newline at end of file
+    user = relationship("User", back_populates="orders")
+
+# Aggregates over orders, kept up to date by app/stats.py in the same
+# transaction as every order write
+class ProductStats(Base):
+    __tablename__ = "product_stats"
+
+    product_name = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_quantity = Column(Integer, nullable=False, default=0)
+
+class UserDailyStats(Base):
+    __tablename__ = "user_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_quantity = Column(Integer, nullable=False, default=0)
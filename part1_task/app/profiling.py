@@ -0,0 +1,320 @@
+# app/profiling.py
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries X-Profile-Token matching PROFILE_TOKEN,
+or when it is picked at random at PROFILE_SAMPLE_RATE. Two profilers are
+available:
+
+- cprofile (default): deterministic cProfile of the request, written as a
+  .prof file for pstats, snakeviz or flameprof.
+- stack: wall-clock stack samples every PROFILE_INTERVAL_MS, written as
+  folded stacks (.folded) for flamegraph.pl or speedscope. It also shows time
+  spent waiting, e.g. on SQLite's write lock, which cProfile reports poorly.
+
+The profile covers the request's handler. ProfiledRoute wraps every endpoint:
+a sync handler is profiled in the threadpool worker that runs it, and an async
+handler only while its own coroutine runs on the event loop, not while it
+waits and the loop serves other requests. SQLAlchemy time shows up under the
+handler's frames. The request's SQL statement count and time are also
+returned as headers.
+
+Python 3.12+ allows one active cProfile per process, and it sees every
+thread: there a cprofile report also counts work other threads did while the
+handler ran. The stack mode samples only the handler's thread on any version.
+
+Token requests can add X-Profile-Mode: cprofile|stack, and X-Profile-Output:
+inline to get the report back in place of the response body. Otherwise the
+file name is returned in X-Profile-File. Only one request is profiled at a
+time; others arriving meanwhile are served unprofiled.
+
+    curl -H "X-Profile-Token: $PROFILE_TOKEN" -H "X-Profile-Output: inline" \\
+         localhost:8000/users/?limit=500
+"""
+import asyncio
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+# Functions listed in inline cProfile reports
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+
+MODES = {"cprofile": "prof", "stack": "folded"}
+
+PROFILED = metrics.registry.register(metrics.Counter(
+    "http_requests_profiled_total", "Requests profiled, by trigger", ("trigger",)
+))
+
+class StackSampler:
+    """Samples the stacks of registered threads from a background thread"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._threads = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def add_thread(self, ident: int, label: str) -> None:
+        self._threads[ident] = label
+
+    def remove_thread(self, ident: int) -> None:
+        self._threads.pop(ident, None)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, label in list(self._threads.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.counts[";".join([label] + stack[::-1])] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+class Session:
+    """The single profiler of one request, handed to its handler through a contextvar"""
+
+    def __init__(self, mode: str, interval: float = PROFILE_INTERVAL):
+        self.mode = mode
+        self.profile = cProfile.Profile() if mode == "cprofile" else None
+        self.sampler = StackSampler(interval) if mode == "stack" else None
+        # False until a handler runs; 404s and validation errors never reach one
+        self.ran = False
+
+    def _start(self, label: str) -> None:
+        self.ran = True
+        if self.sampler is not None:
+            self.sampler.add_thread(threading.get_ident(), label)
+        else:
+            self.profile.enable()
+
+    def _stop(self) -> None:
+        if self.sampler is not None:
+            self.sampler.remove_thread(threading.get_ident())
+        else:
+            self.profile.disable()
+
+    def run(self, function, *args, **kwargs):
+        """Call a sync handler under the profiler, in the thread that runs it"""
+        self._start("worker")
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._stop()
+
+    @types.coroutine
+    def run_coroutine(self, coro):
+        """Await an async handler, profiling only the steps where it runs"""
+        value, error = None, None
+        while True:
+            self._start("loop")
+            try:
+                yielded = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self._stop()
+            # Suspended: whatever the loop runs now belongs to other requests
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+    def report(self) -> bytes:
+        if not self.ran:
+            return b"No handler ran for this request\n"
+        if self.sampler is not None:
+            return self.sampler.folded().encode()
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        return out.getvalue().encode()
+
+    def write(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.sampler is not None:
+            with open(path, "w") as f:
+                f.write(self.sampler.folded())
+        else:
+            self.profile.dump_stats(path)
+        _prune(os.path.dirname(path) or ".")
+
+_session: ContextVar[Optional[Session]] = ContextVar("profile_session", default=None)
+
+def _profiled(endpoint):
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return await endpoint(*args, **kwargs)
+            return await session.run_coroutine(endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return endpoint(*args, **kwargs)
+            return session.run(endpoint, *args, **kwargs)
+
+    wrapper._profiled = True
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """Route class that runs the endpoint under the profiled request's profiler"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not getattr(endpoint, "_profiled", False):
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _prune(directory: str) -> None:
+    # Keep the newest PROFILE_MAX_FILES, so sampling cannot fill the disk
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(tuple(MODES.values()))),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in entries[:max(0, len(entries) - PROFILE_MAX_FILES)]:
+        os.remove(entry.path)
+
+def _file_name(scope, mode: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:60] or "root"
+    return f"{int(time.time() * 1000)}-{scope['method']}-{slug}-{secrets.token_hex(3)}.{MODES[mode]}"
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that picks the requests to profile and reports on them"""
+
+    def __init__(
+        self,
+        app,
+        token: str = PROFILE_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        mode: str = PROFILE_MODE,
+        directory: str = PROFILE_DIR,
+        interval: float = PROFILE_INTERVAL,
+    ):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.directory = directory
+        self.interval = interval
+        self._busy = False
+
+    def _authorized(self, headers: dict) -> bool:
+        supplied = headers.get(b"x-profile-token")
+        return bool(self.token) and supplied is not None and hmac.compare_digest(
+            supplied, self.token.encode()
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if self._authorized(headers):
+            trigger = "token"
+            mode = headers.get(b"x-profile-mode", self.mode.encode()).decode("latin-1")
+            inline = headers.get(b"x-profile-output") == b"inline"
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger, mode, inline = "sample", self.mode, False
+        else:
+            await self.app(scope, receive, send)
+            return
+        if mode not in MODES:
+            mode = self.mode
+
+        self._busy = True
+        PROFILED.inc(trigger)
+        session = Session(mode, self.interval)
+        name = None if inline else _file_name(scope, mode)
+        start_message = {}
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                start_message.update(message)
+                if inline:
+                    return
+                # Only a token holder learns file names and SQL timings; a
+                # sampled profile is written without telling the client
+                if session.ran and trigger == "token":
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"x-profile-file", name.encode())
+                    ] + _sql_headers()}
+            elif inline and message["type"] == "http.response.body":
+                return
+            await send(message)
+
+        token = _session.set(session)
+        try:
+            if session.sampler is not None:
+                session.sampler.start()
+            await self.app(scope, receive, profiled_send)
+        finally:
+            _session.reset(token)
+            if session.sampler is not None:
+                session.sampler.stop()
+            self._busy = False
+
+        if inline:
+            await _send_report(send, start_message.get("status", 500), session)
+        elif session.ran:
+            await run_in_threadpool(session.write, os.path.join(self.directory, name))
+
+def _sql_headers() -> list:
+    # Kept by MetricsMiddleware, which runs outside this one
+    stats = metrics.current_request_stats()
+    if stats is None:
+        return []
+    return [
+        (b"x-profile-sql-statements", str(stats.statements).encode()),
+        (b"x-profile-sql-ms", f"{stats.db_seconds * 1000:.3f}".encode()),
+    ]
+
+async def _send_report(send, status_code: int, session: Session) -> None:
+    body = session.report()
+    headers = [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"content-length", str(len(body)).encode()),
+    ] + _sql_headers()
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
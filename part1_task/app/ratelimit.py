@@ -0,0 +1,224 @@
+# app/ratelimit.py
+"""
+Admission control: per-client token buckets and concurrency limits.
+
+Requests are checked before they reach a handler, so a bursting client is
+turned away with 429 instead of occupying the threadpool, and when too many
+requests are already in flight new ones wait in a short, bounded queue and
+get 503 once it is full or the wait times out. Both answers carry Retry-After.
+
+Limits are rules keyed by a selector: a method list ("GET,HEAD"), a route
+template ("* /orders/bulk"), or both ("POST /orders/bulk"). The most specific
+matching rule applies, so writes, which serialize on SQLite, can be held to a
+lower rate and fewer concurrent slots than reads:
+
+    RATE_LIMITS="GET,HEAD=100:200;POST,PUT,PATCH,DELETE=20:40;POST /orders/bulk=1:5"
+    CONCURRENCY_LIMITS="POST,PUT,PATCH,DELETE=4"
+    MAX_CONCURRENCY=64 MAX_QUEUE=128 QUEUE_TIMEOUT_MS=250
+
+Rate limits are "<requests per second>:<burst>" per client; clients are told
+apart by X-API-Key, falling back to the client address. Everything is off
+unless configured.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from starlette.routing import compile_path
+
+from . import metrics
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+CONCURRENCY_LIMITS = os.getenv("CONCURRENCY_LIMITS", "")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "0"))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "0"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT_MS", "250")) / 1000
+API_KEY_HEADER = os.getenv("API_KEY_HEADER", "x-api-key").lower()
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+EXEMPT_PATHS = tuple(path for path in os.getenv("ADMISSION_EXEMPT_PATHS", "/metrics").split(",") if path)
+MAX_TRACKED_CLIENTS = int(os.getenv("MAX_TRACKED_CLIENTS", "100000"))
+
+REJECTED = metrics.registry.register(metrics.Counter(
+    "http_requests_rejected_total", "Requests turned away by admission control", ("reason",)
+))
+
+class Rule:
+    def __init__(self, selector: str, value: str):
+        self.selector = selector.strip()
+        methods, _, path = self.selector.partition(" ")
+        self.methods = None if methods == "*" else frozenset(m.strip().upper() for m in methods.split(","))
+        self.path_regex = compile_path(path.strip())[0] if path.strip() else None
+        self.value = value.strip()
+        self.specificity = (self.path_regex is not None, self.methods is not None)
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self.path_regex is None or self.path_regex.match(path) is not None
+
+def parse_rules(spec: str) -> List[Rule]:
+    rules = []
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        selector, separator, value = part.rpartition("=")
+        if not separator or not selector.strip():
+            raise ValueError(f"Invalid limit rule: {part!r}")
+        rules.append(Rule(selector, value))
+    # Most specific first: method and path, then path, then method, then "*"
+    return sorted(rules, key=lambda rule: rule.specificity, reverse=True)
+
+def _match(rules: List[Rule], method: str, path: str) -> Optional[Rule]:
+    return next((rule for rule in rules if rule.matches(method, path)), None)
+
+class TokenBuckets:
+    """One bucket per (rule, client), idle buckets evicted least recently used first"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_size: int = MAX_TRACKED_CLIENTS):
+        self.clock = clock
+        self.max_size = max_size
+        self._buckets: "OrderedDict[tuple, list]" = OrderedDict()
+
+    def take(self, key: tuple, rate: float, burst: float) -> float:
+        """Take a token; return 0 on success or the seconds until one is available"""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+class ConcurrencyGate:
+    """At most `limit` holders; up to `max_queue` more wait for `timeout` seconds"""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+def _parse_rate(value: str) -> Tuple[float, float]:
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+def client_id(scope) -> str:
+    """Identify the caller by API key, or by address when there is none"""
+    headers = dict(scope.get("headers") or ())
+    api_key = headers.get(API_KEY_HEADER.encode())
+    if api_key:
+        return "key:" + api_key.decode("latin-1")
+    if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+        return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware, so rejected requests never reach routing or the threadpool"""
+
+    def __init__(
+        self,
+        app,
+        rate_limits: str = RATE_LIMITS,
+        concurrency_limits: str = CONCURRENCY_LIMITS,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT,
+        exempt_paths: Tuple[str, ...] = EXEMPT_PATHS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.app = app
+        self.rate_rules = parse_rules(rate_limits)
+        self.rates = {id(rule): _parse_rate(rule.value) for rule in self.rate_rules}
+        self.route_gates = [
+            (rule, ConcurrencyGate(int(rule.value), max_queue, queue_timeout))
+            for rule in parse_rules(concurrency_limits)
+        ]
+        self.gate = ConcurrencyGate(max_concurrency, max_queue, queue_timeout) if max_concurrency > 0 else None
+        self.exempt_paths = exempt_paths
+        self.buckets = TokenBuckets(clock)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        rule = _match(self.rate_rules, method, path)
+        if rule is not None:
+            rate, burst = self.rates[id(rule)]
+            wait = self.buckets.take((rule.selector, client_id(scope)), rate, burst)
+            if wait:
+                REJECTED.inc("rate_limit")
+                await _reject(send, 429, "Rate limit exceeded", wait)
+                return
+
+        # The route's own slots first, then the global ones
+        route_gate = next((gate for rule, gate in self.route_gates if rule.matches(method, path)), None)
+        gates = [gate for gate in (route_gate, self.gate) if gate is not None]
+        acquired = []
+
+        def release():
+            while acquired:
+                acquired.pop().release()
+
+        async def send_wrapper(message):
+            await send(message)
+            # Background tasks run inside the app call after the last chunk;
+            # they must not hold the request's slots
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        try:
+            for gate in gates:
+                if not await gate.acquire():
+                    REJECTED.inc("overloaded")
+                    await _reject(send, 503, "Server is busy, retry later", gate.timeout)
+                    return
+                acquired.append(gate)
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+async def _reject(send, status_code: int, detail: str, retry_after: float) -> None:
+    body = ('{"detail":"' + detail + '"}').encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
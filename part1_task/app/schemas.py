@@ -1,6 +1,6 @@
 # schemas.py
-from pydantic import BaseModel, EmailStr, conint
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, conint, field_validator
+from datetime import date, datetime
 from typing import List, Optional
 
 class OrderBase(BaseModel):
@@ -10,6 +10,18 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     pass
 
+class OrderUpdate(BaseModel):
+    product_name: Optional[str] = None
+    quantity: Optional[conint(gt=0)] = None
+
+    # Fields may be omitted, but not set to null: both columns are NOT NULL
+    @field_validator("product_name", "quantity")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
 class Order(OrderBase):
     id: int
     user_id: int
@@ -35,4 +47,46 @@ class User(UserBase):
     orders: List[Order] = []
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: Optional[int] = None
+    # Only present for ?ids= requests: the requested ids that were not found
+    missing: Optional[List[int]] = Field(default=None, exclude_if=lambda value: value is None)
+
+class UserPage(BaseModel):
+    items: List[User]
+    next_cursor: Optional[int] = None
+    missing: Optional[List[int]] = Field(default=None, exclude_if=lambda value: value is None)
+
+class OrderBulkCreate(OrderBase):
+    user_id: int
+
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
+class UserBulkResult(BaseModel):
+    created: List[User]
+    errors: List[BulkError]
+
+class OrderBulkResult(BaseModel):
+    created: List[Order]
+    errors: List[BulkError]
+
+class ProductStats(BaseModel):
+    product_name: str
+    order_count: int
+    total_quantity: int
+
+class DailyStats(BaseModel):
+    day: date
+    order_count: int
+    total_quantity: int
+
+class UserStats(BaseModel):
+    user_id: int
+    order_count: int
+    total_quantity: int
+    days: List[DailyStats]
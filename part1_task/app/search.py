@@ -0,0 +1,131 @@
+# app/search.py
+"""
+Full-text search over users (name, email) and orders (product_name).
+
+On SQLite the columns are mirrored into FTS5 tables, users_fts and orders_fts.
+These are external-content tables, so they hold only the index and read text
+from the base tables. Triggers keep them in step with every insert, update and
+delete, including the cascade from deleting a user. The tables and triggers are
+installed by create_all() and, for existing databases, by the search_index
+migration. Every query term is matched as a prefix, so "jo exa" finds
+john@example.com. Results are ordered by bm25 rank.
+
+Where FTS5 is not available (PostgreSQL, or SQLite built without it), search
+falls back to unranked LIKE matching in id order. It is still correct, but it
+scans the tables.
+"""
+import re
+from typing import Dict, List
+
+from sqlalchemy import and_, column, event, inspect, literal_column, or_, select, table
+from sqlalchemy.engine import Connection, Engine
+
+from . import models
+
+# Index tables, their content tables and the columns they mirror
+FTS_TABLES = {
+    "users_fts": ("users", ("name", "email")),
+    "orders_fts": ("orders", ("product_name",)),
+}
+
+def _ddl(fts_name: str) -> List[str]:
+    content, columns = FTS_TABLES[fts_name]
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{name}" for name in columns)
+    old = ", ".join(f"old.{name}" for name in columns)
+    insert_new = f"INSERT INTO {fts_name}(rowid, {names}) VALUES (new.id, {new});"
+    delete_old = f"INSERT INTO {fts_name}({fts_name}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    return [
+        # prefix='2 3' indexes short prefixes, so "jo*" does not scan every "j" term
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5("
+        f"{names}, content='{content}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {content} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {content} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF {names} ON {content} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+def fts5_available(conn: Connection) -> bool:
+    return conn.dialect.name == "sqlite" and bool(
+        conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar()
+    )
+
+def _installed(conn: Connection) -> set:
+    return set(conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE '%_fts%'"
+    ).scalars())
+
+def install(conn: Connection) -> bool:
+    """Create missing index tables and triggers; True if anything was created"""
+    if not fts5_available(conn):
+        return False
+    existing = _installed(conn)
+    created = False
+    for fts_name in FTS_TABLES:
+        wanted = {fts_name, f"{fts_name}_ai", f"{fts_name}_ad", f"{fts_name}_au"}
+        if wanted <= existing:
+            continue
+        for statement in _ddl(fts_name):
+            conn.exec_driver_sql(statement)
+        # Index the rows written while the table or its triggers were missing
+        conn.exec_driver_sql(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')")
+        created = True
+    return created
+
+@event.listens_for(models.Base.metadata, "after_create")
+def _after_create(target, connection, tables=(), **kw):
+    if models.User.__table__ in tables or models.Order.__table__ in tables:
+        install(connection)
+
+@event.listens_for(models.Base.metadata, "before_drop")
+def _before_drop(target, connection, tables=(), **kw):
+    # An external-content index outlives its table and would point at stale rowids
+    if connection.dialect.name == "sqlite":
+        for fts_name in FTS_TABLES:
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts_name}")
+
+_fts_engines: Dict[Engine, bool] = {}
+
+def uses_fts(db_engine: Engine) -> bool:
+    if db_engine not in _fts_engines:
+        _fts_engines[db_engine] = inspect(db_engine).has_table("users_fts")
+    return _fts_engines[db_engine]
+
+def terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q)
+
+def match_expression(words: List[str]) -> str:
+    # Each term quoted, so FTS5 operators and column filters in user input are
+    # taken literally, and starred for prefix matching; terms are ANDed
+    return " ".join(f'"{word}"*' for word in words)
+
+def _fts_search(model, fts_name: str, words: List[str]):
+    fts = table(fts_name, column("rowid"), column("rank"))
+    return (
+        select(model)
+        .join(fts, fts.c.rowid == model.id)
+        .where(literal_column(fts_name).op("MATCH")(match_expression(words)))
+        .order_by(fts.c.rank, model.id)
+    )
+
+def _escape_like(word: str) -> str:
+    return word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _like_search(model, columns, words: List[str]):
+    return (
+        select(model)
+        .where(and_(*(
+            or_(*(col.ilike(f"%{_escape_like(word)}%", escape="\\") for col in columns)) for word in words
+        )))
+        .order_by(model.id)
+    )
+
+def users_query(db_engine: Engine, words: List[str]):
+    if uses_fts(db_engine):
+        return _fts_search(models.User, "users_fts", words)
+    return _like_search(models.User, (models.User.name, models.User.email), words)
+
+def orders_query(db_engine: Engine, words: List[str]):
+    if uses_fts(db_engine):
+        return _fts_search(models.Order, "orders_fts", words)
+    return _like_search(models.Order, (models.Order.product_name,), words)
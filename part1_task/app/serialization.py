@@ -0,0 +1,71 @@
+# app/serialization.py
+"""
+Fast response serialization.
+
+Returning an ORM object from a handler makes FastAPI validate it against
+response_model (from_attributes, EmailStr checks included) and then encode
+the validated model, once per request and again for every nested order. Rows
+read back from our own database were validated on the way in, so handlers
+instead build plain dicts straight from the mapped columns and encode them
+with orjson, falling back to pydantic-core when orjson is not installed.
+
+response_model stays on the routes for the OpenAPI schema. Setting
+VALIDATE_RESPONSES=true checks every payload against the prebuilt adapters,
+which the test suite does to keep the dicts and the schemas in step.
+"""
+import os
+from typing import Any, List, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+from . import schemas
+
+VALIDATE_RESPONSES = os.getenv("VALIDATE_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+USER = TypeAdapter(schemas.User)
+ORDER = TypeAdapter(schemas.Order)
+USER_PAGE = TypeAdapter(schemas.UserPage)
+ORDER_PAGE = TypeAdapter(schemas.OrderPage)
+USER_BULK_RESULT = TypeAdapter(schemas.UserBulkResult)
+ORDER_BULK_RESULT = TypeAdapter(schemas.OrderBulkResult)
+PRODUCT_STATS_LIST = TypeAdapter(List[schemas.ProductStats])
+USER_STATS = TypeAdapter(schemas.UserStats)
+_ANY = TypeAdapter(Any)
+
+# Column attributes copied for each schema, in schema field order
+USER_COLUMNS = tuple(name for name in schemas.User.model_fields if name != "orders")
+ORDER_COLUMNS = tuple(schemas.Order.model_fields)
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return _ANY.dump_json(data)
+
+def order_to_dict(db_order) -> dict:
+    return {name: getattr(db_order, name) for name in ORDER_COLUMNS}
+
+def user_to_dict(db_user) -> dict:
+    data = {name: getattr(db_user, name) for name in USER_COLUMNS}
+    data["orders"] = [order_to_dict(db_order) for db_order in db_user.orders]
+    return data
+
+def json_response(
+    payload: Any,
+    status_code: int = 200,
+    adapter: Optional[TypeAdapter] = None,
+    headers: Optional[dict] = None
+) -> Response:
+    if adapter is not None and VALIDATE_RESPONSES:
+        adapter.validate_python(payload)
+    return Response(
+        content=dumps(payload),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers
+    )
@@ -0,0 +1,108 @@
+# app/server.py
+"""
+Multi-worker launcher:
+
+    python -m app.server
+    WEB_CONCURRENCY=8 PORT=8080 python -m app.server
+
+Runs Gunicorn with Uvicorn workers (pip install gunicorn uvicorn). The master
+creates the schema and runs migrations once, then imports the app (preload)
+and forks the workers, so they start from a ready schema with nothing left to
+import. Each worker still warms up its own connection pools in the lifespan
+handler, because connections must not cross a fork. A worker is replaced
+gracefully after MAX_REQUESTS requests, with jitter so they do not all recycle
+at once.
+
+Without Gunicorn (e.g. on Windows), the same settings are passed to Uvicorn's
+own process manager. That mode has no preload, and max-requests only ends a
+worker, which Uvicorn then replaces.
+"""
+import os
+import sys
+from typing import List
+
+APP = "app.main:app"
+
+def default_workers() -> int:
+    # Respect CPU affinity (containers, taskset) where the platform reports it
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+def options() -> dict:
+    """Gunicorn settings, from the environment"""
+    return {
+        "bind": os.getenv("BIND", f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"),
+        "workers": int(os.getenv("WEB_CONCURRENCY", "0")) or default_workers(),
+        "worker_class": os.getenv("WORKER_CLASS", "uvicorn.workers.UvicornWorker"),
+        "preload_app": True,
+        "max_requests": int(os.getenv("MAX_REQUESTS", "10000")),
+        "max_requests_jitter": int(os.getenv("MAX_REQUESTS_JITTER", "1000")),
+        "keepalive": int(os.getenv("KEEPALIVE", "5")),
+        "backlog": int(os.getenv("BACKLOG", "2048")),
+        "timeout": int(os.getenv("WORKER_TIMEOUT", "60")),
+        "graceful_timeout": int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        "post_fork": _post_fork,
+    }
+
+def _post_fork(server, worker) -> None:
+    # Pooled connections opened by the master belong to it; close=False drops
+    # them from this worker's pools without closing the master's sockets
+    from .database import engine, read_engines
+
+    for db_engine in [engine, *read_engines]:
+        db_engine.dispose(close=False)
+
+def _prepare_schema() -> None:
+    from .database import engine
+    from .migrations import setup
+
+    applied = setup(engine)
+    if applied:
+        print("Applied migrations: " + ", ".join(applied), file=sys.stderr)
+    engine.dispose()
+    os.environ["SCHEMA_SETUP"] = "false"
+
+def _run_gunicorn(settings: dict) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .main import app
+
+            return app
+
+    Server().run()
+
+def _run_uvicorn(settings: dict) -> None:
+    import uvicorn
+
+    host, _, port = settings["bind"].rpartition(":")
+    uvicorn.run(
+        APP,
+        host=host,
+        port=int(port),
+        workers=settings["workers"],
+        limit_max_requests=settings["max_requests"],
+        timeout_keep_alive=settings["keepalive"],
+        backlog=settings["backlog"],
+        timeout_graceful_shutdown=settings["graceful_timeout"],
+    )
+
+def main(argv: List[str]) -> int:
+    settings = options()
+    _prepare_schema()
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        _run_uvicorn(settings)
+    else:
+        _run_gunicorn(settings)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,182 @@
+# app/stats.py
+"""
+Order aggregates: totals per product and per user per day.
+
+Order writes call apply()/apply_async() with the rows they removed and added,
+inside the transaction that changes the orders. The changes are folded into
+per-key deltas and applied with INSERT ... ON CONFLICT DO UPDATE, so
+concurrent writers increment the same row instead of overwriting it. Rows
+that reach zero are kept and filtered out on read.
+
+rebuild() recomputes both tables from orders and check() compares them,
+which is also available from the command line:
+
+    python -m app.stats check
+    python -m app.stats rebuild
+"""
+import sys
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from . import models
+
+ProductStats = models.ProductStats.__table__
+UserDailyStats = models.UserDailyStats.__table__
+
+def _upsert(dialect_name: str, table, keys: Tuple[str, ...]):
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            "order_count": table.c.order_count + stmt.excluded.order_count,
+            "total_quantity": table.c.total_quantity + stmt.excluded.total_quantity,
+        }
+    )
+
+def _deltas(removed: Iterable, added: Iterable) -> Tuple[dict, dict]:
+    products = defaultdict(lambda: [0, 0])
+    user_days = defaultdict(lambda: [0, 0])
+    for sign, rows in ((-1, removed), (1, added)):
+        for row in rows:
+            for delta in (products[row.product_name], user_days[(row.user_id, row.order_date.date())]):
+                delta[0] += sign
+                delta[1] += sign * row.quantity
+    return products, user_days
+
+def changes(dialect_name: str, removed: Iterable = (), added: Iterable = ()) -> List[tuple]:
+    """(statement, parameters) pairs that move the aggregates from removed to added
+
+    Rows need user_id, product_name, quantity and order_date attributes, as
+    ORM orders and RETURNING rows have. Keys whose totals do not change are
+    skipped, so rewriting an order with the same values issues nothing.
+    """
+    products, user_days = _deltas(removed, added)
+    product_rows = [
+        {"product_name": name, "order_count": count, "total_quantity": quantity}
+        for name, (count, quantity) in products.items()
+        if count or quantity
+    ]
+    user_day_rows = [
+        {"user_id": user_id, "day": day, "order_count": count, "total_quantity": quantity}
+        for (user_id, day), (count, quantity) in user_days.items()
+        if count or quantity
+    ]
+
+    statements = []
+    if product_rows:
+        statements.append((_upsert(dialect_name, ProductStats, ("product_name",)), product_rows))
+    if user_day_rows:
+        statements.append((_upsert(dialect_name, UserDailyStats, ("user_id", "day")), user_day_rows))
+    return statements
+
+def apply(db, removed: Iterable = (), added: Iterable = ()) -> None:
+    for stmt, params in changes(db.get_bind().dialect.name, removed, added):
+        db.execute(stmt, params)
+
+async def apply_async(db, removed: Iterable = (), added: Iterable = ()) -> None:
+    for stmt, params in changes(db.bind.dialect.name, removed, added):
+        await db.execute(stmt, params)
+
+def remove_user_orders(user_id: int):
+    """Subtract all of a user's orders from the product totals in one statement
+
+    Run it just before deleting the user; the user's daily rows go with the
+    user through ON DELETE CASCADE.
+    """
+    Order = models.Order
+    per_product = (
+        select(
+            Order.product_name,
+            func.count().label("order_count"),
+            func.sum(Order.quantity).label("total_quantity"),
+        )
+        .where(Order.user_id == user_id)
+        .group_by(Order.product_name)
+        .subquery()
+    )
+    return (
+        update(ProductStats)
+        .where(ProductStats.c.product_name == per_product.c.product_name)
+        .values(
+            order_count=ProductStats.c.order_count - per_product.c.order_count,
+            total_quantity=ProductStats.c.total_quantity - per_product.c.total_quantity,
+        )
+    )
+
+def _product_totals():
+    Order = models.Order
+    return (
+        select(Order.product_name, func.count(), func.sum(Order.quantity))
+        .group_by(Order.product_name)
+    )
+
+def _user_day_totals():
+    Order = models.Order
+    day = func.date(Order.order_date)
+    return (
+        select(Order.user_id, day, func.count(), func.sum(Order.quantity))
+        .where(Order.user_id.is_not(None))
+        .group_by(Order.user_id, day)
+    )
+
+def rebuild(db_engine: Engine) -> None:
+    """Recompute both aggregate tables from orders in one transaction"""
+    with db_engine.begin() as conn:
+        conn.execute(delete(ProductStats))
+        conn.execute(delete(UserDailyStats))
+        conn.execute(insert(ProductStats).from_select(
+            ["product_name", "order_count", "total_quantity"], _product_totals()
+        ))
+        conn.execute(insert(UserDailyStats).from_select(
+            ["user_id", "day", "order_count", "total_quantity"], _user_day_totals()
+        ))
+
+def _keyed(rows) -> dict:
+    # Keys are compared as strings: dates come back as date objects from
+    # user_daily_stats but as strings from SQLite's date()
+    return {tuple(str(value) for value in row[:-2]): tuple(row[-2:]) for row in rows}
+
+def check(db_engine: Engine) -> List[str]:
+    """Differences between the stored aggregates and a fresh computation"""
+    problems = []
+    with db_engine.connect() as conn:
+        for table, keys, totals in (
+            (ProductStats, ("product_name",), _product_totals()),
+            (UserDailyStats, ("user_id", "day"), _user_day_totals()),
+        ):
+            stored = _keyed(conn.execute(
+                select(*(table.c[key] for key in keys), table.c.order_count, table.c.total_quantity)
+                .where(table.c.order_count != 0)
+            ))
+            expected = _keyed(conn.execute(totals))
+            for key in sorted(stored.keys() | expected.keys()):
+                if stored.get(key) != expected.get(key):
+                    problems.append(
+                        f"{table.name} {', '.join(key)}: stored {stored.get(key)}, expected {expected.get(key)}"
+                    )
+    return problems
+
+def main(argv: List[str]) -> int:
+    from .database import engine
+
+    command = argv[0] if argv else "check"
+    if command not in ("check", "rebuild"):
+        print("usage: python -m app.stats [check|rebuild]")
+        return 2
+
+    models.Base.metadata.create_all(bind=engine)
+    if command == "rebuild":
+        rebuild(engine)
+    problems = check(engine)
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} mismatch(es)" if problems else "Aggregates match orders")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
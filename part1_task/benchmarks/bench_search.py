@@ -0,0 +1,127 @@
+# benchmarks/bench_search.py
+"""
+Search latency: FTS5 (app/search.py) against the LIKE fallback.
+
+Fills a file-backed SQLite database with --users users and as many orders,
+through the triggers that keep the FTS5 tables in step, then runs the same
+random queries through both query paths. Latency percentiles are reported
+per path and per kind of query: "lookup" (name fragment plus part of an
+email), "product" (product word plus number) and "broad" (one common word,
+matching a tenth of a table). Results are printed as JSON.
+
+    python benchmarks/bench_search.py                   # 1,000,000 users and orders
+    python benchmarks/bench_search.py --users 100000 --queries 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import Base, create_db_engine
+from app import models, search
+from benchmarks.common import latency_summary
+
+FIRST = ["john", "mary", "ahmed", "li", "sofia", "lukas", "amara", "ken", "olga", "pedro", "nina", "omar"]
+LAST = ["smith", "garcia", "chen", "kowalski", "okafor", "tanaka", "muller", "rossi", "novak", "silva"]
+DOMAINS = ["example.com", "mail.org", "corp.net", "uni.edu"]
+ADJECTIVES = ["blue", "red", "large", "small", "steel", "wooden", "smart", "classic", "eco", "pro"]
+NOUNS = ["widget", "gadget", "lamp", "chair", "kettle", "router", "backpack", "monitor", "speaker", "desk"]
+
+def populate(db_engine, users: int, batch: int, rng: random.Random) -> float:
+    started = time.perf_counter()
+    with Session(bind=db_engine) as db:
+        for start in range(0, users, batch):
+            rows = []
+            for i in range(start, min(start + batch, users)):
+                first, last = rng.choice(FIRST), rng.choice(LAST)
+                rows.append({
+                    "id": i + 1,
+                    "name": f"{first.title()} {last.title()}",
+                    "email": f"{first}.{last}{i}@{rng.choice(DOMAINS)}",
+                })
+            db.execute(insert(models.User), rows)
+            db.execute(insert(models.Order), [
+                {
+                    "user_id": row["id"],
+                    "product_name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {row['id'] % 1000}".title(),
+                    "quantity": 1,
+                }
+                for row in rows
+            ])
+            db.commit()
+    return time.perf_counter() - started
+
+def make_queries(count: int, users: int, rng: random.Random) -> list:
+    """(kind, words) pairs: lookups that narrow down to a few rows, and broad single words"""
+    queries = []
+    for _ in range(count):
+        kind = rng.choice(["lookup", "product", "broad"])
+        if kind == "lookup":
+            # What a support agent types: part of the name and of the email
+            i = rng.randrange(users)
+            words = [rng.choice(FIRST)[:3], f"{rng.choice(LAST)}{i}"[:-1]]
+        elif kind == "product":
+            words = [rng.choice(NOUNS)[:4], str(rng.randrange(1000))]
+        else:
+            words = [rng.choice(LAST + NOUNS)]
+        queries.append((kind, words))
+    return queries
+
+def run_path(db_engine, queries: list, limit: int, fts: bool) -> dict:
+    # uses_fts() caches its answer per engine; overriding it selects the path
+    search._fts_engines[db_engine] = fts
+    samples = {}
+    with Session(bind=db_engine) as db:
+        for kind, words in queries:
+            build = search.orders_query if kind == "product" else search.users_query
+            start = time.perf_counter()
+            db.scalars(build(db_engine, words).limit(limit)).all()
+            samples.setdefault(kind, []).append(time.perf_counter() - start)
+    return {
+        "path": "fts5" if fts else "like",
+        "latency_ms": {kind: latency_summary(values) for kind, values in sorted(samples.items())},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=50, help="Page size, as in GET /search/...")
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'search.db')}")
+        Base.metadata.create_all(bind=db_engine)
+        load_seconds = populate(db_engine, args.users, args.batch, rng)
+
+        queries = make_queries(args.queries, args.users, rng)
+        like, fts = [run_path(db_engine, queries, args.limit, fts) for fts in (False, True)]
+        fts["speedup_p50"] = {
+            kind: round(like["latency_ms"][kind]["p50"] / fts["latency_ms"][kind]["p50"], 1)
+            for kind in fts["latency_ms"]
+        }
+        db_engine.dispose()
+
+    print(json.dumps({
+        "users": args.users,
+        "orders": args.users,
+        "load_seconds_with_triggers": round(load_seconds, 1),
+        "queries": args.queries,
+        "results": [like, fts],
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/bench_serialization.py
+"""
+Response serialization: FastAPI's response_model path against app/serialization.py.
+
+The response_model path is what FastAPI runs when a handler returns ORM
+objects: validate them against the route's response field (from_attributes,
+EmailStr checks) and encode the result through JSONResponse. The fast path
+builds dicts from the mapped columns and encodes them with orjson. Both run
+over the same ORM objects loaded once from an in-memory database, so only
+serialization is measured. Results are printed as JSON.
+
+    python benchmarks/bench_serialization.py --iterations 2000 --page-size 100
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.pool import StaticPool
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import Base, create_db_engine
+from app import models, schemas, serialization
+from benchmarks.common import latency_summary
+
+def load_fixtures(users: int, orders_per_user: int):
+    db_engine = create_db_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=db_engine)
+    db = Session(bind=db_engine)
+    user_ids = db.scalars(
+        insert(models.User).returning(models.User.id),
+        [{"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(users)]
+    ).all()
+    db.execute(insert(models.Order), [
+        {"user_id": user_id, "product_name": f"product-{i}", "quantity": 1 + i % 5}
+        for user_id in user_ids
+        for i in range(orders_per_user)
+    ])
+    db.commit()
+
+    user_rows = db.scalars(
+        select(models.User).options(selectinload(models.User.orders)).order_by(models.User.id)
+    ).all()
+    order_rows = db.scalars(select(models.Order).order_by(models.Order.id).limit(users)).all()
+    # Touch every attribute up front so neither path pays for lazy loads
+    for user in user_rows:
+        serialization.user_to_dict(user)
+    return db, user_rows, order_rows
+
+def _response_field(model):
+    return APIRoute("/bench", lambda: None, response_model=model).response_field
+
+def _time(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def _time_async(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run_case(name: str, model, content, fast, iterations: int) -> dict:
+    field = _response_field(model)
+
+    async def response_model_path():
+        value = await serialize_response(field=field, response_content=content)
+        return JSONResponse(value).body
+
+    def fast_path():
+        return fast().body
+
+    # Both paths must produce the same document
+    baseline_body = asyncio.run(response_model_path())
+    assert json.loads(baseline_body) == json.loads(fast_path()), name
+
+    baseline = asyncio.run(_time_async(response_model_path, iterations))
+    optimized = _time(fast_path, iterations)
+    return {
+        "payload": name,
+        "bytes": len(baseline_body),
+        "response_model_ms": latency_summary(baseline),
+        "fast_path_ms": latency_summary(optimized),
+        "speedup": round(sum(baseline) / sum(optimized), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100, help="users/orders per list page")
+    parser.add_argument("--orders-per-user", type=int, default=5)
+    args = parser.parse_args()
+
+    db, users, orders = load_fixtures(args.page_size, args.orders_per_user)
+    single = users[0]
+    page = {"items": users, "next_cursor": users[-1].id}
+    order_page = {"items": orders, "next_cursor": orders[-1].id}
+
+    results = [
+        run_case(
+            "order", schemas.Order, orders[0],
+            lambda: serialization.json_response(serialization.order_to_dict(orders[0])),
+            args.iterations
+        ),
+        run_case(
+            "user_with_orders", schemas.User, single,
+            lambda: serialization.json_response(serialization.user_to_dict(single)),
+            args.iterations
+        ),
+        run_case(
+            "order_page", schemas.OrderPage, order_page,
+            lambda: serialization.json_response({
+                "items": [serialization.order_to_dict(o) for o in orders],
+                "next_cursor": order_page["next_cursor"],
+            }),
+            args.iterations
+        ),
+        run_case(
+            "user_page", schemas.UserPage, page,
+            lambda: serialization.json_response({
+                "items": [serialization.user_to_dict(u) for u in users],
+                "next_cursor": page["next_cursor"],
+            }),
+            args.iterations
+        ),
+    ]
+    db.close()
+    backend = "orjson" if serialization.orjson is not None else "pydantic-core"
+    print(json.dumps({"json_backend": backend, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_write_batching.py
+"""
+Order insert throughput with and without group commit (app/batching.py).
+
+--threads writers insert --rows orders in total against a file-backed SQLite
+database. "per-request" commits every row in its own transaction, which is
+what POST /orders/ does by default; "group-commit" submits every row to a
+WriteBatcher and waits for it, as POST /orders/ does with WRITE_BATCHING=true.
+Both keep the order aggregates up to date. Results are printed as JSON.
+
+    python benchmarks/bench_write_batching.py --rows 5000 --threads 32
+    python benchmarks/bench_write_batching.py --synchronous FULL --window-ms 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.common import latency_summary
+
+def run_mode(name: str, db_url: str, args, batched: bool) -> dict:
+    from sqlalchemy import insert
+    from sqlalchemy.orm import Session
+
+    from app import batching, models, stats
+    from app.database import Base, create_db_engine
+
+    db_engine = create_db_engine(db_url)
+    Base.metadata.drop_all(bind=db_engine)
+    Base.metadata.create_all(bind=db_engine)
+    with Session(bind=db_engine) as db:
+        user_id = db.scalar(
+            insert(models.User).values(name="Bench", email="bench@example.com").returning(models.User.id)
+        )
+        db.commit()
+
+    batcher = batching.WriteBatcher(db_engine, args.window_ms / 1000, args.max_rows) if batched else None
+
+    def insert_one(values: dict):
+        if batcher is not None:
+            return batcher.submit(values).result()
+        with Session(bind=db_engine) as db:
+            row = db.execute(insert(models.Order).returning(*batching.ORDER_RETURNING), [values]).one()
+            stats.apply(db, added=[row])
+            db.commit()
+            return row
+
+    per_thread = args.rows // args.threads
+    latencies = [[] for _ in range(args.threads)]
+    errors = []
+
+    def writer(slot: int):
+        for i in range(per_thread):
+            start = time.perf_counter()
+            try:
+                insert_one({"user_id": user_id, "product_name": f"product-{i % 20}", "quantity": 1})
+            except Exception as e:
+                errors.append(str(e))
+            latencies[slot].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=writer, args=(slot,)) for slot in range(args.threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    if batcher is not None:
+        batcher.close()
+    consistent = stats.check(db_engine) == []
+    db_engine.dispose()
+    samples = [latency for slot in latencies for latency in slot]
+    return {
+        "mode": name,
+        "rows": len(samples),
+        "threads": args.threads,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(len(samples) / elapsed, 1),
+        "latency_ms": latency_summary(samples),
+        "aggregates_consistent": consistent,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-rows", type=int, default=500)
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+
+    # app.database reads the SQLite profile at import time
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            run_mode("per-request", f"sqlite:///{tmp}/unbatched.db", args, batched=False),
+            run_mode("group-commit", f"sqlite:///{tmp}/batched.db", args, batched=True),
+        ]
+    results[1]["speedup"] = round(results[1]["rows_per_second"] / results[0]["rows_per_second"], 2)
+    print(json.dumps({"synchronous": args.synchronous, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
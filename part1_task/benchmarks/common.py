@@ -0,0 +1,20 @@
+# benchmarks/common.py
+import statistics
+from typing import List
+
+def latency_summary(samples: List[float]) -> dict:
+    """p50/p95/p99/max of latencies given in seconds, reported in milliseconds"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        value = round(ordered[0] * 1000, 3)
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    # Inclusive interpolates between samples, so no percentile exceeds the max
+    quantiles = statistics.quantiles(ordered, n=100, method="inclusive")
+    return {
+        "p50": round(quantiles[49] * 1000, 3),
+        "p95": round(quantiles[94] * 1000, 3),
+        "p99": round(quantiles[98] * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
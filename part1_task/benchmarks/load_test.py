@@ -0,0 +1,257 @@
+# benchmarks/load_test.py
+"""
+In-process load test for the users/orders API.
+
+Drives the ASGI app through httpx.AsyncClient at a fixed concurrency against a
+file-backed database, with a weighted mix of reads and writes over every user
+and order endpoint. Prints (or writes) a JSON report with requests/sec and
+p50/p95/p99 latency per endpoint so runs can be compared.
+
+    python benchmarks/load_test.py --concurrency 32 --requests 5000
+    python benchmarks/load_test.py --duration 30 --output baseline.json
+    python benchmarks/load_test.py --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.common import latency_summary
+
+# name -> weight; reads dominate, as they do in production traffic
+DEFAULT_MIX = {
+    "GET /users/{id}": 30,
+    "GET /orders/{id}": 25,
+    "GET /users/": 5,
+    "GET /orders/": 5,
+    "POST /users/": 5,
+    "POST /orders/": 10,
+    "PUT /users/{id}": 4,
+    "PUT /orders/{id}": 4,
+    "PATCH /orders/{id}": 4,
+    "DELETE /orders/{id}": 4,
+    "DELETE /users/{id}": 2,
+    "POST /orders/bulk": 2,
+}
+
+class Workload:
+    """Picks operations and keeps track of ids that exist"""
+
+    def __init__(self, client, mix: dict, seed: int):
+        self.client = client
+        self.random = random.Random(seed)
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.user_ids = []
+        self.order_ids = []
+        self.counter = 0
+
+    def _email(self) -> str:
+        self.counter += 1
+        return f"load-{os.getpid()}-{self.counter}@example.com"
+
+    def _pick(self, ids: list):
+        return self.random.choice(ids) if ids else 0
+
+    async def seed(self, users: int, orders_per_user: int):
+        for start in range(0, users, 1000):
+            batch = [{"name": "Seed", "email": self._email()} for _ in range(min(1000, users - start))]
+            response = await self.client.post("/users/bulk", json=batch)
+            self.user_ids.extend(user["id"] for user in response.json()["created"])
+        rows = [
+            {"user_id": user_id, "product_name": f"product-{i % 50}", "quantity": 1 + i % 5}
+            for user_id in self.user_ids
+            for i in range(orders_per_user)
+        ]
+        for start in range(0, len(rows), 5000):
+            response = await self.client.post("/orders/bulk", json=rows[start:start + 5000])
+            self.order_ids.extend(order["id"] for order in response.json()["created"])
+
+    async def run_one(self):
+        name = self.random.choices(self.operations, self.weights)[0]
+        client = self.client
+        if name == "GET /users/{id}":
+            response = await client.get(f"/users/{self._pick(self.user_ids)}")
+        elif name == "GET /orders/{id}":
+            response = await client.get(f"/orders/{self._pick(self.order_ids)}")
+        elif name == "GET /users/":
+            response = await client.get("/users/", params={"after_id": self._pick(self.user_ids), "limit": 20})
+        elif name == "GET /orders/":
+            response = await client.get("/orders/", params={"user_id": self._pick(self.user_ids), "limit": 20})
+        elif name == "POST /users/":
+            response = await client.post("/users/", json={"name": "Load", "email": self._email()})
+            if response.status_code == 201:
+                self.user_ids.append(response.json()["id"])
+        elif name == "POST /orders/":
+            response = await client.post(
+                "/orders/",
+                params={"user_id": self._pick(self.user_ids)},
+                json={"product_name": "load-product", "quantity": 1}
+            )
+            if response.status_code == 201:
+                self.order_ids.append(response.json()["id"])
+        elif name == "PUT /users/{id}":
+            response = await client.put(f"/users/{self._pick(self.user_ids)}", json={"name": "Renamed"})
+        elif name == "PUT /orders/{id}":
+            response = await client.put(
+                f"/orders/{self._pick(self.order_ids)}",
+                json={"product_name": "updated-product", "quantity": 2}
+            )
+        elif name == "PATCH /orders/{id}":
+            response = await client.patch(f"/orders/{self._pick(self.order_ids)}", json={"quantity": 3})
+        elif name == "DELETE /orders/{id}":
+            order_id = self._pick(self.order_ids)
+            response = await client.delete(f"/orders/{order_id}")
+            if order_id in self.order_ids:
+                self.order_ids.remove(order_id)
+        elif name == "DELETE /users/{id}":
+            user_id = self._pick(self.user_ids)
+            response = await client.delete(f"/users/{user_id}")
+            if user_id in self.user_ids:
+                self.user_ids.remove(user_id)
+        else:
+            rows = [
+                {"user_id": self._pick(self.user_ids), "product_name": "bulk-product", "quantity": 1}
+                for _ in range(50)
+            ]
+            response = await client.post("/orders/bulk", json=rows)
+            if response.status_code == 201:
+                self.order_ids.extend(order["id"] for order in response.json()["created"])
+        return name, response.status_code
+
+async def run_load(args) -> dict:
+    # The app builds its engine at import time, so configure it first
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    if args.no_cache:
+        os.environ["CACHE_BACKEND"] = "none"
+
+    import httpx
+    from app.main import app
+    from app import models
+    from app.database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        workload = Workload(client, DEFAULT_MIX, args.seed)
+        await workload.seed(args.users, args.orders_per_user)
+
+        latencies = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+        deadline = time.perf_counter() + args.duration if args.duration else None
+        remaining = args.requests
+
+        async def worker():
+            nonlocal remaining
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                else:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                start = time.perf_counter()
+                name, status_code = await workload.run_one()
+                latencies[name].append(time.perf_counter() - start)
+                statuses[name][status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    engine.dispose()
+    endpoints = {}
+    for name in sorted(latencies):
+        samples = latencies[name]
+        server_errors = sum(count for code, count in statuses[name].items() if code >= 500)
+        endpoints[name] = {
+            "requests": len(samples),
+            "requests_per_second": round(len(samples) / elapsed, 1),
+            "latency_ms": latency_summary(samples),
+            "status_codes": {str(code): count for code, count in sorted(statuses[name].items())},
+            "server_errors": server_errors,
+        }
+
+    all_samples = [latency for samples in latencies.values() for latency in samples]
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests if not args.duration else None,
+            "duration": args.duration,
+            "seed_users": args.users,
+            "seed_orders_per_user": args.orders_per_user,
+            "cache": not args.no_cache,
+        },
+        "total": {
+            "requests": len(all_samples),
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(all_samples) / elapsed, 1),
+            "latency_ms": latency_summary(all_samples),
+            "server_errors": sum(e["server_errors"] for e in endpoints.values()),
+        },
+        "endpoints": endpoints,
+    }
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Relative change in throughput and p95 latency per endpoint"""
+    changes = {}
+    for name, result in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            "requests_per_second_change": round(
+                result["requests_per_second"] / before["requests_per_second"] - 1, 3
+            ) if before["requests_per_second"] else None,
+            "p95_change": round(
+                result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1, 3
+            ) if before["latency_ms"]["p95"] else None,
+        }
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead")
+    parser.add_argument("--users", type=int, default=200, help="users to seed before the run")
+    parser.add_argument("--orders-per-user", type=int, default=5)
+    parser.add_argument("--db", default=None, help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the entity cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON report to diff against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db is None:
+            args.db = os.path.join(tmp, "loadtest.db")
+        report = asyncio.run(run_load(args))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import sqlite3
+import sys
+from pathlib import Path
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import async_routes, cache, serialization, stats
+from app.database import Base, get_async_db, create_async_db_engine
+
+@pytest.fixture
+def client(tmp_path):
+    # aiosqlite cannot share an in-memory database with the sync engine, so
+    # both point at the same temporary file
+    db_path = tmp_path / "async_test.db"
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=sync_engine)
+
+    async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(async_routes.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+    cache.backend.clear()
+    serialization.VALIDATE_RESPONSES = True
+    with TestClient(app) as test_client:
+        yield test_client
+
+    # Every test leaves the maintained aggregates consistent with orders
+    assert stats.check(sync_engine) == []
+
+    sync_engine.dispose()
+
+@pytest.fixture
+def user_id(client):
+    response = client.post(
+        "/users/",
+        json={"name": "Test User", "email": "test@example.com"}
+    )
+    return response.json()["id"]
+
+class TestAsyncUsers:
+    def test_create_user(self, client):
+        response = client.post(
+            "/users/",
+            json={"name": "Test User", "email": "test@example.com"}
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["email"] == "test@example.com"
+        assert data["orders"] == []
+        assert "created_at" in data
+
+    def test_create_user_duplicate_email(self, client, user_id):
+        response = client.post(
+            "/users/",
+            json={"name": "Another User", "email": "test@example.com"}
+        )
+        assert response.status_code == 400
+        assert "Email already registered" in response.json()["detail"]
+
+    def test_read_user_with_orders(self, client, user_id):
+        client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 3}
+        )
+        response = client.get(f"/users/{user_id}")
+        assert response.status_code == 200
+        orders = response.json()["orders"]
+        assert len(orders) == 1
+        assert orders[0]["quantity"] == 3
+
+    def test_update_user(self, client, user_id):
+        response = client.put(f"/users/{user_id}", json={"name": "Updated User"})
+        assert response.status_code == 200
+        assert response.json()["name"] == "Updated User"
+        assert response.json()["email"] == "test@example.com"
+
+    def test_delete_user_cascades_orders(self, client, user_id):
+        order_id = client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        ).json()["id"]
+
+        assert client.delete(f"/users/{user_id}").status_code == 204
+        assert client.get(f"/users/{user_id}").status_code == 404
+        assert client.get(f"/orders/{order_id}").status_code == 404
+
+    def test_delete_user_locks_before_totals(self, client, user_id, tmp_path, monkeypatch):
+        # An order committed between the totals update and the DELETE would be
+        # cascaded away without leaving the totals
+        client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        )
+        remove_user_orders = stats.remove_user_orders
+        blocked = []
+
+        def insert_meanwhile(uid):
+            with sqlite3.connect(tmp_path / "async_test.db", timeout=0) as conn:
+                try:
+                    conn.execute(
+                        "INSERT INTO orders (user_id, product_name, quantity) VALUES (?, 'Test Product', 1)",
+                        (uid,)
+                    )
+                except sqlite3.OperationalError as e:
+                    blocked.append(str(e))
+            return remove_user_orders(uid)
+
+        monkeypatch.setattr(stats, "remove_user_orders", insert_meanwhile)
+        assert client.delete(f"/users/{user_id}").status_code == 204
+        assert blocked == ["database is locked"]
+
+    def test_delete_user_not_found(self, client):
+        assert client.delete("/users/999").status_code == 404
+
+    def test_background_delete(self, client, user_id, monkeypatch):
+        monkeypatch.setattr(async_routes, "DELETE_CHUNK_SIZE", 2)
+        for _ in range(3):
+            client.post(
+                "/orders/",
+                params={"user_id": user_id},
+                json={"product_name": "Test Product", "quantity": 1}
+            )
+
+        response = client.delete(f"/users/{user_id}", params={"background": True})
+        assert response.status_code == 202
+        assert client.get(f"/users/{user_id}").status_code == 404
+
+class TestAsyncOrders:
+    def test_order_lifecycle(self, client, user_id):
+        response = client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        )
+        assert response.status_code == 201
+        order_id = response.json()["id"]
+        assert response.json()["order_date"]
+
+        response = client.put(
+            f"/orders/{order_id}",
+            json={"product_name": "Updated Product", "quantity": 2}
+        )
+        assert response.status_code == 200
+        assert response.json()["quantity"] == 2
+
+        assert client.get(f"/orders/{order_id}").json()["product_name"] == "Updated Product"
+        assert client.delete(f"/orders/{order_id}").status_code == 204
+        assert client.get(f"/orders/{order_id}").status_code == 404
+
+    def test_patch_order(self, client, user_id):
+        order_id = client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        ).json()["id"]
+
+        response = client.patch(f"/orders/{order_id}", json={"quantity": 4})
+        assert response.status_code == 200
+        assert response.json()["product_name"] == "Test Product"
+        assert response.json()["quantity"] == 4
+        assert client.patch("/orders/999", json={"quantity": 1}).status_code == 404
+        assert client.patch(f"/orders/{order_id}", json={"quantity": None}).status_code == 422
+
+    def test_create_order_user_not_found(self, client):
+        response = client.post(
+            "/orders/",
+            params={"user_id": 999},
+            json={"product_name": "Test Product", "quantity": 1}
+        )
+        assert response.status_code == 404
+        assert "User not found" in response.json()["detail"]
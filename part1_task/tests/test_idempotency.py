@@ -0,0 +1,109 @@
+import asyncio
+import sys
+from pathlib import Path
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+def make_app(**options):
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.release = asyncio.Event()
+
+    @app.post("/items/", status_code=201)
+    async def create_item(item: dict):
+        app.state.calls += 1
+        if item.get("slow"):
+            await app.state.release.wait()
+        if item.get("fail"):
+            raise RuntimeError("boom")
+        return {"id": app.state.calls, **item}
+
+    options.setdefault("store", IdempotencyStore())
+    app.add_middleware(IdempotencyMiddleware, paths=("/items/",), **options)
+    return app
+
+def test_repeat_is_replayed():
+    app = make_app()
+    client = TestClient(app)
+    first = client.post("/items/", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+    second = client.post("/items/", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+
+    assert first.status_code == second.status_code == 201
+    assert first.json() == second.json() == {"id": 1, "name": "a"}
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert app.state.calls == 1
+
+def test_requests_without_key_are_untouched():
+    app = make_app()
+    client = TestClient(app)
+    client.post("/items/", json={"name": "a"})
+    client.post("/items/", json={"name": "a"})
+    assert app.state.calls == 2
+
+def test_keys_are_per_client():
+    app = make_app()
+    client = TestClient(app)
+    for api_key in ("a", "b"):
+        client.post("/items/", json={}, headers={"Idempotency-Key": "k1", "X-API-Key": api_key})
+    assert app.state.calls == 2
+
+def test_reused_key_with_different_body():
+    client = TestClient(make_app())
+    client.post("/items/", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+    response = client.post("/items/", json={"name": "b"}, headers={"Idempotency-Key": "k1"})
+    assert response.status_code == 422
+
+def test_server_errors_are_not_kept():
+    app = make_app()
+    client = TestClient(app, raise_server_exceptions=False)
+    for _ in range(2):
+        response = client.post("/items/", json={"fail": True}, headers={"Idempotency-Key": "k1"})
+        assert response.status_code == 500
+    assert app.state.calls == 2
+
+def test_entries_expire():
+    now = [0.0]
+    app = make_app(store=IdempotencyStore(ttl=10, clock=lambda: now[0]))
+    client = TestClient(app)
+    client.post("/items/", json={}, headers={"Idempotency-Key": "k1"})
+    now[0] = 11
+    client.post("/items/", json={}, headers={"Idempotency-Key": "k1"})
+    assert app.state.calls == 2
+
+def test_store_is_bounded():
+    store = IdempotencyStore(max_size=2)
+    for i in range(3):
+        store.set(("client", str(i)), {})
+    assert store.size() == 2
+    assert store.get(("client", "0")) is None
+
+async def _concurrent(app, count):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        requests = [
+            asyncio.ensure_future(client.post("/items/", json={"slow": True}, headers={"Idempotency-Key": "k1"}))
+            for _ in range(count)
+        ]
+        await asyncio.sleep(0.05)
+        app.state.release.set()
+        return await asyncio.gather(*requests)
+
+def test_concurrent_duplicates_wait_for_the_first():
+    app = make_app()
+    responses = asyncio.run(_concurrent(app, 3))
+    assert app.state.calls == 1
+    assert all(response.json() == {"id": 1, "slow": True} for response in responses)
+    assert sum(response.headers.get("idempotent-replayed") == "true" for response in responses) == 2
+
+def test_concurrent_duplicate_gives_up():
+    app = make_app(wait_timeout=0.01)
+    statuses = sorted(response.status_code for response in asyncio.run(_concurrent(app, 2)))
+    assert statuses == [201, 409]
+    assert app.state.calls == 1
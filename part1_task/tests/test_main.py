@@ -1,17 +1,25 @@
+import csv
+import io
+import json
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 # Add the parent directory to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
+from app import main
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_db, set_sqlite_pragmas
 from app.models import User, Order
+from app import batching, cache, database, export, fieldsets, idempotency, metrics, profiling, schemas, search, serialization, stats
 
 # Create a test database in memory
 SQLALCHEMY_DATABASE_URL = "sqlite://"
@@ -21,6 +29,8 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
+event.listen(engine, "connect", set_sqlite_pragmas)
+metrics.instrument_engine(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def override_get_db():
@@ -32,11 +42,16 @@ def override_get_db():
 
 app.dependency_overrides[get_db] = override_get_db
 
+# Check every fast-path payload against the response schemas
+serialization.VALIDATE_RESPONSES = True
+
 client = TestClient(app)
 
 @pytest.fixture(autouse=True)
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    cache.backend.clear()
+    idempotency.store.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -198,6 +213,40 @@ class TestOrders:
         assert data["product_name"] == "Updated Product"
         assert data["quantity"] == 2
 
+    def test_patch_order(self, user_id):
+        order_id = client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        ).json()["id"]
+
+        response = client.patch(f"/orders/{order_id}", json={"quantity": 7})
+        assert response.status_code == 200
+        assert response.json()["product_name"] == "Test Product"
+        assert response.json()["quantity"] == 7
+
+        assert client.patch(f"/orders/{order_id}", json={"quantity": 0}).status_code == 422
+        assert client.patch("/orders/999", json={"quantity": 2}).status_code == 404
+
+    def test_patch_order_rejects_null(self, user_id):
+        order_id = client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": 1}
+        ).json()["id"]
+
+        for body in ({"quantity": None}, {"product_name": None}, {"product_name": "Other", "quantity": None}):
+            response = client.patch(f"/orders/{order_id}", json=body)
+            assert response.status_code == 422
+        order = client.get(f"/orders/{order_id}").json()
+        assert order["product_name"] == "Test Product"
+        assert order["quantity"] == 1
+
+    def test_delete_order_not_found(self):
+        response = client.delete("/orders/999")
+        assert response.status_code == 404
+        assert "Order not found" in response.json()["detail"]
+
     def test_delete_order(self, user_id):
         # Create order first
         create_response = client.post(
@@ -213,4 +262,995 @@ class TestOrders:
 
         # Verify order is deleted
         get_response = client.get(f"/orders/{order_id}")
-        assert get_response.status_code == 404
\ No newline at end of file
+        assert get_response.status_code == 404
+
+class TestListEndpoints:
+    @pytest.fixture
+    def user_ids(self):
+        return [
+            client.post(
+                "/users/",
+                json={"name": f"User {i}", "email": f"user{i}@example.com"}
+            ).json()["id"]
+            for i in range(5)
+        ]
+
+    def test_list_users_keyset_pagination(self, user_ids):
+        response = client.get("/users/", params={"limit": 2})
+        assert response.status_code == 200
+        page = response.json()
+        assert [u["id"] for u in page["items"]] == user_ids[:2]
+        assert page["next_cursor"] == user_ids[1]
+
+        seen = [u["id"] for u in page["items"]]
+        while page["next_cursor"] is not None:
+            page = client.get(
+                "/users/", params={"limit": 2, "after_id": page["next_cursor"]}
+            ).json()
+            seen.extend(u["id"] for u in page["items"])
+        assert seen == user_ids
+
+    def test_list_orders_filters(self, user_ids):
+        for user_id in user_ids[:2]:
+            for quantity in (1, 2):
+                client.post(
+                    "/orders/",
+                    params={"user_id": user_id},
+                    json={"product_name": "Test Product", "quantity": quantity}
+                )
+
+        page = client.get("/orders/", params={"user_id": user_ids[1]}).json()
+        assert len(page["items"]) == 2
+        assert all(o["user_id"] == user_ids[1] for o in page["items"])
+        assert page["next_cursor"] is None
+
+        page = client.get(
+            "/orders/", params={"order_date_from": "2000-01-01T00:00:00"}
+        ).json()
+        assert len(page["items"]) == 4
+        page = client.get(
+            "/orders/", params={"order_date_to": "2000-01-01T00:00:00"}
+        ).json()
+        assert page["items"] == []
+
+    def test_order_on_date_boundary(self, user_ids):
+        # The server stamps order_date in whole seconds; [from, to) must hold at it
+        client.post("/orders/", params={"user_id": user_ids[0]}, json={"product_name": "Test Product", "quantity": 1})
+        orders = client.get("/orders/").json()["items"]
+        stamp = orders[0]["order_date"]
+        same = {o["id"] for o in orders if o["order_date"] == stamp}
+
+        page = client.get("/orders/", params={"order_date_from": stamp}).json()
+        assert same <= {o["id"] for o in page["items"]}
+        page = client.get("/orders/", params={"order_date_to": stamp}).json()
+        assert not same & {o["id"] for o in page["items"]}
+
+    def test_list_users_ndjson_stream(self, user_ids):
+        response = client.get(
+            "/users/",
+            params={"after_id": user_ids[0]},
+            headers={"Accept": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == user_ids[1:]
+
+    def test_list_limit_validation(self):
+        assert client.get("/orders/", params={"limit": 0}).status_code == 422
+
+    def test_users_by_ids(self, user_ids):
+        wanted = [user_ids[3], 999, user_ids[0], user_ids[3]]
+        response = client.get("/users/", params={"ids": ",".join(map(str, wanted))})
+        assert response.status_code == 200
+        page = response.json()
+        assert [u["id"] for u in page["items"]] == [user_ids[3], user_ids[0]]
+        assert page["missing"] == [999]
+        assert "missing" not in client.get("/users/").json()
+
+    def test_orders_by_ids_in_chunks(self, user_ids, monkeypatch):
+        order_ids = [
+            client.post(
+                "/orders/", params={"user_id": user_ids[0]}, json={"product_name": "P", "quantity": 1}
+            ).json()["id"]
+            for _ in range(5)
+        ]
+        monkeypatch.setattr(main, "IN_CLAUSE_CHUNK_SIZE", 2)
+        wanted = list(reversed(order_ids)) + [0]
+        page = client.get("/orders/", params={"ids": ",".join(map(str, wanted))}).json()
+        assert [o["id"] for o in page["items"]] == wanted[:-1]
+        assert page["missing"] == [0]
+
+    def test_ids_validation(self):
+        assert client.get("/users/", params={"ids": "1,x"}).status_code == 400
+        too_many = ",".join(str(i) for i in range(main.MAX_PAGE_SIZE + 1))
+        assert client.get("/orders/", params={"ids": too_many}).status_code == 400
+        for huge in ("99999999999999999999999", str(main.MAX_ID + 1), f"1,-{main.MAX_ID + 1}"):
+            assert client.get("/users/", params={"ids": huge}).status_code == 400
+            assert client.get("/orders/", params={"ids": huge}).status_code == 400
+        assert client.get("/users/", params={"ids": str(main.MAX_ID)}).json()["missing"] == [main.MAX_ID]
+
+    def test_page_schemas_omit_missing_unless_set(self):
+        assert "missing" not in schemas.UserPage(items=[]).model_dump(mode="json")
+        assert schemas.OrderPage(items=[], missing=[]).model_dump(mode="json")["missing"] == []
+
+
+class TestUserOrders:
+    @pytest.fixture
+    def user_id(self):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        other_id = client.post("/users/", json={"name": "Other User", "email": "other@example.com"}).json()["id"]
+        for quantity in range(1, 6):
+            client.post("/orders/", params={"user_id": user_id}, json={"product_name": "Test Product", "quantity": quantity})
+        client.post("/orders/", params={"user_id": other_id}, json={"product_name": "Test Product", "quantity": 1})
+        return user_id
+
+    def test_keyset_pagination_newest_first(self, user_id):
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor is not None:
+                params["after_id"] = cursor
+            page = client.get(f"/users/{user_id}/orders", params=params).json()
+            seen.extend(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert len(seen) == 5
+        assert all(order["user_id"] == user_id for order in seen)
+        # Orders created within the same second fall back to id order
+        assert [order["quantity"] for order in seen] == [5, 4, 3, 2, 1]
+
+    def test_date_range(self, user_id):
+        page = client.get(
+            f"/users/{user_id}/orders", params={"order_date_from": "2000-01-01T00:00:00"}
+        ).json()
+        assert len(page["items"]) == 5
+        page = client.get(
+            f"/users/{user_id}/orders", params={"order_date_to": "2000-01-01T00:00:00"}
+        ).json()
+        assert page["items"] == []
+
+    def test_order_on_date_boundary(self, user_id):
+        orders = client.get(f"/users/{user_id}/orders").json()["items"]
+        stamp = orders[0]["order_date"]
+        same = {o["id"] for o in orders if o["order_date"] == stamp}
+
+        page = client.get(f"/users/{user_id}/orders", params={"order_date_from": stamp}).json()
+        assert same <= {o["id"] for o in page["items"]}
+        page = client.get(f"/users/{user_id}/orders", params={"order_date_to": stamp}).json()
+        assert not same & {o["id"] for o in page["items"]}
+
+    def test_cursor_of_another_user(self, user_id):
+        [foreign] = [o["id"] for o in client.get("/orders/").json()["items"] if o["user_id"] != user_id]
+        for after_id in (foreign, 999999):
+            response = client.get(f"/users/{user_id}/orders", params={"after_id": after_id})
+            assert response.status_code == 400
+            assert "after_id" in response.json()["detail"]
+
+        # A valid cursor on the last order still ends the list normally
+        last = client.get(f"/users/{user_id}/orders").json()["items"][-1]["id"]
+        page = client.get(f"/users/{user_id}/orders", params={"after_id": last}).json()
+        assert page == {"items": [], "next_cursor": None}
+
+    def test_user_not_found(self):
+        assert client.get("/users/999/orders").status_code == 404
+        user_id = client.post("/users/", json={"name": "New User", "email": "new@example.com"}).json()["id"]
+        response = client.get(f"/users/{user_id}/orders")
+        assert response.status_code == 200
+        assert response.json() == {"items": [], "next_cursor": None}
+
+    def test_uses_composite_index(self):
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT * FROM orders WHERE user_id = 1 "
+                "ORDER BY order_date DESC, id DESC"
+            ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_orders_user_id_order_date" in details
+        assert "TEMP B-TREE" not in details
+
+class TestOrderStats:
+    def _create_order(self, user_id, product_name, quantity):
+        return client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": product_name, "quantity": quantity}
+        ).json()["id"]
+
+    def _products(self):
+        return {p["product_name"]: (p["order_count"], p["total_quantity"]) for p in client.get("/stats/products").json()}
+
+    def test_order_writes_keep_aggregates(self):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        first = self._create_order(user_id, "Widget", 2)
+        second = self._create_order(user_id, "Widget", 3)
+        self._create_order(user_id, "Gadget", 1)
+        assert self._products() == {"Widget": (2, 5), "Gadget": (1, 1)}
+
+        client.put(f"/orders/{first}", json={"product_name": "Gadget", "quantity": 4})
+        client.patch(f"/orders/{second}", json={"quantity": 10})
+        assert self._products() == {"Widget": (1, 10), "Gadget": (2, 5)}
+
+        client.delete(f"/orders/{second}")
+        assert self._products() == {"Gadget": (2, 5)}
+
+        user_stats = client.get(f"/users/{user_id}/stats").json()
+        assert user_stats["order_count"] == 2
+        assert user_stats["total_quantity"] == 5
+        assert len(user_stats["days"]) == 1
+        assert stats.check(engine) == []
+
+    def test_bulk_and_user_deletes_keep_aggregates(self, monkeypatch):
+        monkeypatch.setattr(main, "DELETE_CHUNK_SIZE", 2)
+        user_ids = [
+            client.post("/users/", json={"name": "User", "email": f"user{i}@example.com"}).json()["id"]
+            for i in range(3)
+        ]
+        client.post("/orders/bulk", json=[
+            {"user_id": user_id, "product_name": "Widget", "quantity": 1}
+            for user_id in user_ids
+            for _ in range(3)
+        ])
+        assert self._products() == {"Widget": (9, 9)}
+
+        client.delete(f"/users/{user_ids[0]}")
+        client.delete(f"/users/{user_ids[1]}", params={"background": True})
+        assert self._products() == {"Widget": (3, 3)}
+        assert stats.check(engine) == []
+
+    def test_user_stats_not_found(self):
+        assert client.get("/users/999/stats").status_code == 404
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        assert client.get(f"/users/{user_id}/stats").json() == {
+            "user_id": user_id, "order_count": 0, "total_quantity": 0, "days": []
+        }
+
+    def test_check_and_rebuild(self):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        self._create_order(user_id, "Widget", 2)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE product_stats SET total_quantity = 99")
+
+        assert stats.check(engine) == ["product_stats Widget: stored (1, 99), expected (1, 2)"]
+        stats.rebuild(engine)
+        assert stats.check(engine) == []
+        assert self._products() == {"Widget": (1, 2)}
+
+class TestWriteBatching:
+    @pytest.fixture
+    def batcher(self, monkeypatch):
+        batcher = batching.WriteBatcher(engine, window=0.05, max_rows=100)
+        monkeypatch.setattr(batching, "order_batcher", batcher)
+        yield batcher
+        batcher.close()
+
+    def test_concurrent_rows_share_a_commit(self, batcher):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        commits = []
+
+        def count(conn):
+            commits.append(conn)
+
+        event.listen(engine, "commit", count)
+        try:
+            futures = [
+                batcher.submit({"user_id": user_id, "product_name": f"product-{i}", "quantity": i + 1})
+                for i in range(20)
+            ]
+            rows = [future.result(timeout=5) for future in futures]
+        finally:
+            event.remove(engine, "commit", count)
+        assert [row["product_name"] for row in rows] == [f"product-{i}" for i in range(20)]
+        assert len({row["id"] for row in rows}) == 20
+        assert len(commits) == 1
+        assert stats.check(engine) == []
+
+    def test_bad_row_fails_alone(self, batcher):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        good = batcher.submit({"user_id": user_id, "product_name": "Widget", "quantity": 1})
+        bad = batcher.submit({"user_id": 999, "product_name": "Widget", "quantity": 1})
+        assert good.result(timeout=5)["user_id"] == user_id
+        with pytest.raises(IntegrityError):
+            bad.result(timeout=5)
+
+    def test_create_order_endpoint(self, batcher):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        response = client.post(
+            "/orders/", params={"user_id": user_id}, json={"product_name": "Widget", "quantity": 2}
+        )
+        assert response.status_code == 201
+        assert response.json()["quantity"] == 2
+        assert client.get(f"/orders/{response.json()['id']}").json()["product_name"] == "Widget"
+
+        response = client.post(
+            "/orders/", params={"user_id": 999}, json={"product_name": "Widget", "quantity": 2}
+        )
+        assert response.status_code == 404
+
+class TestIdempotency:
+    def test_retried_order_is_created_once(self):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        for _ in range(3):
+            response = client.post(
+                "/orders/",
+                params={"user_id": user_id},
+                json={"product_name": "Widget", "quantity": 2},
+                headers={"Idempotency-Key": "order-1"}
+            )
+            assert response.status_code == 201
+        assert response.headers["idempotent-replayed"] == "true"
+        assert len(client.get("/orders/", params={"user_id": user_id}).json()["items"]) == 1
+        assert client.get(f"/users/{user_id}/stats").json()["order_count"] == 1
+
+    def test_replayed_conflict(self):
+        client.post("/users/", json={"name": "Test User", "email": "test@example.com"})
+        headers = {"Idempotency-Key": "user-2"}
+        first = client.post("/users/", json={"name": "Other", "email": "test@example.com"}, headers=headers)
+        second = client.post("/users/", json={"name": "Other", "email": "test@example.com"}, headers=headers)
+        assert first.status_code == second.status_code == 400
+        assert second.json() == first.json()
+
+class TestSearch:
+    def _seed(self):
+        ids = {}
+        for name, email in [
+            ("John Smith", "john.smith@example.com"),
+            ("Johanna Jones", "jj@mail.org"),
+            ("Mary Major", "mary@example.com"),
+        ]:
+            ids[name] = client.post("/users/", json={"name": name, "email": email}).json()["id"]
+        for product in ["Blue Widget", "Widget", "Red Gadget"]:
+            client.post(
+                "/orders/", params={"user_id": ids["Mary Major"]}, json={"product_name": product, "quantity": 1}
+            )
+        return ids
+
+    def test_prefix_terms_are_anded(self):
+        ids = self._seed()
+        response = client.get("/search/users", params={"q": "joh"})
+        assert response.status_code == 200
+        assert {user["id"] for user in response.json()["items"]} == {ids["John Smith"], ids["Johanna Jones"]}
+
+        items = client.get("/search/users", params={"q": "jo exa"}).json()["items"]
+        assert [user["id"] for user in items] == [ids["John Smith"]]
+
+    def test_ranked_and_paginated(self):
+        self._seed()
+        response = client.get("/search/orders", params={"q": "widget", "limit": 1})
+        first = response.json()
+        # The shorter product name is the closer match
+        assert [order["product_name"] for order in first["items"]] == ["Widget"]
+        assert first["next_cursor"] == 1
+
+        second = client.get(
+            "/search/orders", params={"q": "widget", "limit": 1, "cursor": first["next_cursor"]}
+        ).json()
+        assert [order["product_name"] for order in second["items"]] == ["Blue Widget"]
+        assert second["next_cursor"] is None
+
+    def test_index_follows_writes(self):
+        ids = self._seed()
+        client.put(f"/users/{ids['Mary Major']}", json={"name": "Mary Minor"})
+        assert client.get("/search/users", params={"q": "major"}).json()["items"] == []
+        assert len(client.get("/search/users", params={"q": "minor"}).json()["items"]) == 1
+
+        client.delete(f"/users/{ids['Mary Major']}")
+        assert client.get("/search/orders", params={"q": "gadget"}).json()["items"] == []
+
+    def test_like_fallback(self, monkeypatch):
+        ids = self._seed()
+        monkeypatch.setitem(search._fts_engines, engine, False)
+        items = client.get("/search/users", params={"q": "smith exa"}).json()["items"]
+        assert [user["id"] for user in items] == [ids["John Smith"]]
+
+    def test_query_syntax_is_literal(self):
+        self._seed()
+        response = client.get("/search/users", params={"q": 'name:"john" OR *'})
+        assert response.status_code == 200
+        assert client.get("/search/users", params={"q": "***"}).json() == {"items": [], "next_cursor": None}
+
+class TestExport:
+    @pytest.fixture
+    def order_ids(self):
+        ids = []
+        for i, email in enumerate(["a@example.com", "b@example.com"]):
+            user_id = client.post("/users/", json={"name": f"User {i}", "email": email}).json()["id"]
+            for quantity in (1, 2, 3):
+                ids.append(client.post(
+                    "/orders/", params={"user_id": user_id}, json={"product_name": f"P{quantity}", "quantity": quantity}
+                ).json()["id"])
+        return ids
+
+    def _rows(self, text):
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def test_csv_with_email(self, order_ids):
+        response = client.get("/orders/export", params={"include_email": True})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="orders.csv"' in response.headers["content-disposition"]
+        rows = self._rows(response.text)
+        assert [int(row["id"]) for row in rows] == order_ids
+        assert tuple(rows[0]) == serialization.ORDER_COLUMNS + ("user_email",)
+        assert {row["user_email"] for row in rows} == {"a@example.com", "b@example.com"}
+
+    def test_date_range(self, order_ids):
+        with engine.begin() as conn:
+            conn.execute(
+                update(Order).where(Order.id == order_ids[0]).values(order_date=datetime(2024, 1, 1, 12))
+            )
+        rows = self._rows(client.get(
+            "/orders/export", params={"order_date_from": "2024-01-01", "order_date_to": "2024-01-02"}
+        ).text)
+        assert [int(row["id"]) for row in rows] == [order_ids[0]]
+        assert rows[0]["order_date"] == "2024-01-01T12:00:00"
+
+    def test_order_on_date_boundary(self, order_ids):
+        rows = self._rows(client.get("/orders/export").text)
+        stamp = rows[0]["order_date"]
+        same = {row["id"] for row in rows if row["order_date"] == stamp}
+
+        rows = self._rows(client.get("/orders/export", params={"order_date_from": stamp}).text)
+        assert same <= {row["id"] for row in rows}
+        rows = self._rows(client.get("/orders/export", params={"order_date_to": stamp}).text)
+        assert not same & {row["id"] for row in rows}
+
+    def test_streams_in_chunks(self, order_ids):
+        parts = list(export.stream(engine, "csv", chunk_size=2))
+        assert len(parts) == 3
+        assert len(self._rows(b"".join(parts).decode())) == len(order_ids)
+
+    def test_parquet(self, order_ids):
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.parquet
+
+        response = client.get("/orders/export", params={"format": "parquet"})
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(response.content))
+        assert table.column("id").to_pylist() == order_ids
+
+    def test_parquet_without_pyarrow(self, monkeypatch):
+        monkeypatch.setattr(export, "pyarrow", None)
+        assert client.get("/orders/export", params={"format": "parquet"}).status_code == 501
+        assert client.get("/orders/export", params={"format": "xml"}).status_code == 422
+
+    def test_cli(self, order_ids, tmp_path, monkeypatch):
+        monkeypatch.setattr(database, "engine", engine)
+        output = tmp_path / "orders.csv"
+        assert export.main(["--output", str(output), "--chunk-size", "4"]) == 0
+        assert len(self._rows(output.read_text())) == len(order_ids)
+
+class TestLifespan:
+    def test_startup_sets_up_schema_and_warms_pools(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(main, "engine", engine)
+        monkeypatch.setattr(main, "read_engines", [])
+        monkeypatch.setattr(main.migrations, "setup", lambda db_engine: calls.append(("setup", db_engine)))
+        monkeypatch.setattr(main, "warm_up", lambda db_engine: calls.append(("warm_up", db_engine)))
+        with TestClient(app) as lifespan_client:
+            assert calls == [("setup", engine), ("warm_up", engine)]
+            assert lifespan_client.get("/").status_code == 200
+
+    def test_workers_skip_schema_setup(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(main, "SCHEMA_SETUP", False)
+        monkeypatch.setattr(main, "engine", engine)
+        monkeypatch.setattr(main, "read_engines", [])
+        monkeypatch.setattr(main.migrations, "setup", lambda db_engine: calls.append("setup"))
+        with TestClient(app):
+            pass
+        assert calls == []
+
+    def test_warm_up_fills_the_pool(self, tmp_path):
+        db_engine = database.create_db_engine(f"sqlite:///{tmp_path / 'warm.db'}")
+        assert database.warm_up(db_engine, connections=3) == 3
+        assert db_engine.pool.checkedin() == 3
+        db_engine.dispose()
+
+class TestBackgroundDelete:
+    def test_delete_user_in_chunks(self, monkeypatch):
+        monkeypatch.setattr(main, "DELETE_CHUNK_SIZE", 2)
+        user_id = client.post(
+            "/users/", json={"name": "Big Account", "email": "big@example.com"}
+        ).json()["id"]
+        client.post(
+            "/orders/bulk",
+            json=[{"user_id": user_id, "product_name": "P", "quantity": 1} for _ in range(5)]
+        )
+        other_id = client.post(
+            "/users/", json={"name": "Other", "email": "other@example.com"}
+        ).json()["id"]
+        client.post("/orders/", params={"user_id": other_id}, json={"product_name": "P", "quantity": 1})
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("DELETE FROM orders"):
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            response = client.delete(f"/users/{user_id}", params={"background": True})
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert response.status_code == 202
+        assert len(statements) == 3
+        assert client.get(f"/users/{user_id}").status_code == 404
+        assert client.get("/orders/", params={"user_id": user_id}).json()["items"] == []
+        assert len(client.get(f"/users/{other_id}").json()["orders"]) == 1
+
+    def test_orders_added_during_delete_keep_aggregates(self, monkeypatch):
+        monkeypatch.setattr(main, "DELETE_CHUNK_SIZE", 2)
+        user_id = client.post("/users/", json={"name": "Big Account", "email": "big@example.com"}).json()["id"]
+        client.post("/orders/bulk", json=[{"user_id": user_id, "product_name": "P", "quantity": 1} for _ in range(3)])
+        invalidate_user = cache.invalidate_user
+        adding = []
+
+        def add_order_between_chunks(uid, orders=False):
+            # Another client orders for the user after each committed chunk
+            if not adding and client.get(f"/users/{uid}").status_code == 200:
+                adding.append(uid)
+                client.post("/orders/", params={"user_id": uid}, json={"product_name": "P", "quantity": 1})
+                adding.clear()
+            invalidate_user(uid, orders=orders)
+
+        monkeypatch.setattr(cache, "invalidate_user", add_order_between_chunks)
+        assert client.delete(f"/users/{user_id}", params={"background": True}).status_code == 202
+        assert client.get(f"/users/{user_id}").status_code == 404
+        assert client.get("/stats/products").json() == []
+        assert stats.check(engine) == []
+
+    def test_write_lock_taken_before_read(self, tmp_path):
+        db_engine = database.create_db_engine(f"sqlite:///{tmp_path / 'lock.db'}")
+        Base.metadata.create_all(bind=db_engine)
+        try:
+            with sessionmaker(bind=db_engine)() as first, db_engine.connect() as second:
+                database.lock_for_write(first)
+                first.execute(select(Order.id)).all()
+                assert first.connection().connection.driver_connection.in_transaction
+                second.exec_driver_sql("PRAGMA busy_timeout = 0")
+                with pytest.raises(OperationalError, match="locked"):
+                    second.exec_driver_sql("BEGIN IMMEDIATE")
+                first.commit()
+                # Already writing: nothing more to take
+                first.execute(update(User).where(User.id == 0).values(name="x"))
+                database.lock_for_write(first)
+                first.commit()
+        finally:
+            db_engine.dispose()
+
+    def test_background_delete_not_found(self):
+        response = client.delete("/users/999", params={"background": True})
+        assert response.status_code == 404
+
+class TestQueryCounts:
+    """Guards against lazy loads of User.orders creeping back into user reads"""
+
+    @pytest.fixture
+    def statements(self):
+        executed = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+
+        event.listen(engine, "before_cursor_execute", count)
+        yield executed
+        event.remove(engine, "before_cursor_execute", count)
+
+    @pytest.fixture
+    def user_ids(self):
+        user_ids = []
+        for i in range(5):
+            user_id = client.post(
+                "/users/",
+                json={"name": f"User {i}", "email": f"user{i}@example.com"}
+            ).json()["id"]
+            for _ in range(3):
+                client.post(
+                    "/orders/",
+                    params={"user_id": user_id},
+                    json={"product_name": "Test Product", "quantity": 1}
+                )
+            user_ids.append(user_id)
+        return user_ids
+
+    def test_create_user(self, statements):
+        response = client.post(
+            "/users/",
+            json={"name": "Test User", "email": "test@example.com"}
+        )
+        assert response.status_code == 201
+        assert response.json()["orders"] == []
+        assert len(statements) == 1
+
+    def test_users_by_ids(self, user_ids, statements):
+        response = client.get("/users/", params={"ids": ",".join(map(str, user_ids))})
+        assert all(len(user["orders"]) == 3 for user in response.json()["items"])
+        # One IN query for the users and one for all their orders
+        assert len(statements) == 2
+
+    def test_read_user(self, user_ids, statements):
+        response = client.get(f"/users/{user_ids[0]}")
+        assert len(response.json()["orders"]) == 3
+        assert len(statements) == 2
+
+    def test_read_user_sparse_fields(self, user_ids, statements):
+        response = client.get(f"/users/{user_ids[0]}", params={"fields": "id,email"})
+        assert response.json() == {"id": user_ids[0], "email": "user0@example.com"}
+        assert len(statements) == 1
+
+    def test_read_user_sparse_fields_include_orders(self, user_ids, statements):
+        response = client.get(
+            f"/users/{user_ids[0]}", params={"fields": "id", "include": "orders"}
+        )
+        data = response.json()
+        assert set(data) == {"id", "orders"}
+        assert len(data["orders"]) == 3
+        assert len(statements) == 2
+
+    def test_update_user(self, user_ids, statements):
+        response = client.put(f"/users/{user_ids[0]}", json={"name": "Renamed"})
+        assert response.json()["name"] == "Renamed"
+        assert len(response.json()["orders"]) == 3
+        # UPDATE ... RETURNING plus the orders embedded in the payload
+        assert len(statements) == 2
+
+    def test_order_writes(self, user_ids, statements):
+        response = client.post(
+            "/orders/",
+            params={"user_id": user_ids[0]},
+            json={"product_name": "Test Product", "quantity": 1}
+        )
+        order_id = response.json()["id"]
+        assert response.json()["order_date"]
+        # INSERT ... RETURNING plus one upsert per aggregate table
+        assert len(statements) == 3
+        assert "RETURNING" in statements[0]
+        assert all("ON CONFLICT" in statement for statement in statements[1:])
+
+        statements.clear()
+        client.put(f"/orders/{order_id}", json={"product_name": "Other", "quantity": 2})
+        # Write lock, old values (for the aggregates), UPDATE ... RETURNING and the upserts
+        assert len(statements) == 5
+        assert statements[0] == "BEGIN IMMEDIATE"
+        statements.clear()
+        client.patch(f"/orders/{order_id}", json={"quantity": 3})
+        assert len(statements) == 5
+        assert statements[0] == "BEGIN IMMEDIATE"
+        statements.clear()
+        client.delete(f"/orders/{order_id}")
+        assert len(statements) == 3
+        assert "RETURNING" in statements[0]
+
+    def test_list_users(self, user_ids, statements):
+        response = client.get("/users/")
+        assert len(response.json()["items"]) == 5
+        assert len(statements) == 2
+
+    def test_list_users_without_orders(self, user_ids, statements):
+        response = client.get("/users/", params={"fields": "id,name"})
+        assert all("orders" not in u for u in response.json()["items"])
+        assert len(statements) == 1
+
+    def test_delete_user(self, user_ids, statements):
+        assert client.delete(f"/users/{user_ids[0]}").status_code == 204
+        # Write lock and the user row, then product totals adjusted in one
+        # UPDATE ... FROM, then the cascading DELETE
+        assert len(statements) == 4
+        assert statements[0] == "BEGIN IMMEDIATE"
+        assert statements[1].startswith("SELECT users.id")
+        remaining = client.get("/orders/", params={"user_id": user_ids[0]}).json()
+        assert remaining["items"] == []
+
+    def test_unknown_field(self):
+        response = client.get("/users/1", params={"fields": "id,password"})
+        assert response.status_code == 400
+        assert "password" in response.json()["detail"]
+
+    def test_include_validated_without_fields(self, user_ids):
+        response = client.get(f"/users/{user_ids[0]}", params={"include": "bogus"})
+        assert response.status_code == 400
+        assert "bogus" in response.json()["detail"]
+        assert client.get("/users/", params={"include": "bogus"}).status_code == 400
+        assert client.get(f"/users/{user_ids[0]}", params={"include": "orders"}).status_code == 200
+
+    def test_empty_fields_rejected(self, user_ids):
+        for fields in ("", " , "):
+            response = client.get(f"/users/{user_ids[0]}", params={"fields": fields})
+            assert response.status_code == 400
+        assert client.get("/users/", params={"fields": ""}).status_code == 400
+
+
+class TestBulkCreate:
+    def test_bulk_create_users(self):
+        client.post("/users/", json={"name": "Existing", "email": "taken@example.com"})
+        response = client.post(
+            "/users/bulk",
+            json=[
+                {"name": "User 0", "email": "user0@example.com"},
+                {"name": "Duplicate", "email": "taken@example.com"},
+                {"name": "User 2", "email": "user2@example.com"},
+                {"name": "Repeated", "email": "user0@example.com"},
+                {"name": "Invalid", "email": "not-an-email"},
+            ]
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert [u["email"] for u in data["created"]] == ["user0@example.com", "user2@example.com"]
+        assert all(u["orders"] == [] and u["id"] for u in data["created"])
+        assert [(e["index"], e["detail"]) for e in data["errors"][:3]] == [
+            (1, "Email already registered"),
+            (3, "Email already registered"),
+            (4, data["errors"][2]["detail"]),
+        ]
+        assert "email" in data["errors"][2]["detail"]
+
+        user_id = data["created"][1]["id"]
+        assert client.get(f"/users/{user_id}").json()["name"] == "User 2"
+
+    def test_bulk_create_orders(self):
+        user_id = client.post(
+            "/users/", json={"name": "Test User", "email": "test@example.com"}
+        ).json()["id"]
+        response = client.post(
+            "/orders/bulk",
+            json=[
+                {"user_id": user_id, "product_name": "A", "quantity": 1},
+                {"user_id": 999, "product_name": "B", "quantity": 1},
+                {"user_id": user_id, "product_name": "C", "quantity": 0},
+                {"user_id": user_id, "product_name": "D", "quantity": 4},
+            ]
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert [o["product_name"] for o in data["created"]] == ["A", "D"]
+        assert [e["index"] for e in data["errors"]] == [1, 2]
+        assert data["errors"][0]["detail"] == "User not found"
+        assert "quantity" in data["errors"][1]["detail"]
+
+        orders = client.get("/orders/", params={"user_id": user_id}).json()["items"]
+        assert [o["id"] for o in orders] == [o["id"] for o in data["created"]]
+
+    def test_bulk_create_single_insert(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            client.post(
+                "/users/bulk",
+                json=[{"name": f"U{i}", "email": f"u{i}@example.com"} for i in range(50)]
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        inserts = [s for s in statements if s.startswith("INSERT")]
+        assert len(inserts) == 1
+
+
+class TestEntityCache:
+    @pytest.fixture
+    def user_id(self):
+        return client.post(
+            "/users/",
+            json={"name": "Test User", "email": "test@example.com"}
+        ).json()["id"]
+
+    def _create_order(self, user_id, quantity=1):
+        return client.post(
+            "/orders/",
+            params={"user_id": user_id},
+            json={"product_name": "Test Product", "quantity": quantity}
+        ).json()["id"]
+
+    def test_read_user_hits_cache(self, user_id):
+        first = client.get(f"/users/{user_id}")
+        second = client.get(f"/users/{user_id}")
+        assert first.json() == second.json()
+        stats = client.get("/cache/stats").json()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_etag_not_modified(self, user_id):
+        etag = client.get(f"/users/{user_id}").headers["etag"]
+        response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        client.put(f"/users/{user_id}", json={"name": "Renamed"})
+        response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["name"] == "Renamed"
+        assert response.headers["etag"] != etag
+
+    def test_order_changes_invalidate_user(self, user_id):
+        client.get(f"/users/{user_id}")
+        order_id = self._create_order(user_id)
+        assert len(client.get(f"/users/{user_id}").json()["orders"]) == 1
+
+        client.put(f"/orders/{order_id}", json={"product_name": "Changed", "quantity": 5})
+        assert client.get(f"/users/{user_id}").json()["orders"][0]["quantity"] == 5
+        assert client.get(f"/orders/{order_id}").json()["quantity"] == 5
+
+        client.delete(f"/orders/{order_id}")
+        assert client.get(f"/users/{user_id}").json()["orders"] == []
+        assert client.get(f"/orders/{order_id}").status_code == 404
+
+    def test_delete_user_invalidates_orders(self, user_id):
+        order_id = self._create_order(user_id)
+        assert client.get(f"/orders/{order_id}").status_code == 200
+        client.delete(f"/users/{user_id}")
+        assert client.get(f"/users/{user_id}").status_code == 404
+        assert client.get(f"/orders/{order_id}").status_code == 404
+
+    def test_read_racing_a_write_is_not_stored(self, user_id, monkeypatch):
+        # The write commits and invalidates between the read's query and its store
+        order_id = self._create_order(user_id)
+        user_to_dict = fieldsets.user_to_dict
+        order_to_dict = serialization.order_to_dict
+
+        def user_written_meanwhile(*args):
+            payload = user_to_dict(*args)
+            cache.invalidate_user(user_id)
+            return payload
+
+        def order_written_meanwhile(*args):
+            payload = order_to_dict(*args)
+            cache.invalidate_user(user_id, orders=True)
+            return payload
+
+        monkeypatch.setattr(fieldsets, "user_to_dict", user_written_meanwhile)
+        monkeypatch.setattr(serialization, "order_to_dict", order_written_meanwhile)
+        assert client.get(f"/users/{user_id}").status_code == 200
+        assert client.get(f"/orders/{order_id}").status_code == 200
+        assert cache.backend.size() == 0
+
+        monkeypatch.undo()
+        client.get(f"/users/{user_id}")
+        client.get(f"/orders/{order_id}")
+        assert cache.backend.size() == 2
+
+    def test_lru_skips_stores_invalidated_since(self):
+        lru = cache.LRUCache(maxsize=2, ttl=60)
+        since = lru.generation()
+        lru.delete("a")
+        lru.set("a", {"v": 1}, since=since)
+        lru.set("b", {"v": 2}, since=since)
+        assert lru.get("a") is None
+        assert lru.get("b") == {"v": 2}
+
+        since = lru.generation()
+        lru.invalidate_tag("t")
+        lru.set("c", {"v": 3}, tags=["t"], since=since)
+        assert lru.get("c") is None
+        lru.set("c", {"v": 3}, tags=["t"], since=lru.generation())
+        assert lru.get("c") == {"v": 3}
+
+        # Names that fell off the bounded record count as invalidated
+        since = lru.generation()
+        lru.delete("x", "y", "z")
+        lru.set("x", {"v": 4}, since=since)
+        lru.set("d", {"v": 5}, since=since)
+        assert lru.get("x") is None
+        assert lru.get("d") is None
+
+    def test_lru_bound_and_ttl(self):
+        lru = cache.LRUCache(maxsize=2, ttl=60)
+        lru.set("a", {"v": 1})
+        lru.set("b", {"v": 2})
+        lru.get("a")
+        lru.set("c", {"v": 3})
+        assert lru.get("b") is None
+        assert lru.get("a") == {"v": 1}
+        assert lru.evictions == 1
+
+        expired = cache.LRUCache(maxsize=2, ttl=-1)
+        expired.set("a", {"v": 1}, tags=["t"])
+        assert expired.get("a") is None
+        assert expired.size() == 0
+
+class TestMetrics:
+    def _sample(self, text, prefix):
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_route_labels_and_status_codes(self):
+        before = client.get("/metrics").text
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        client.get(f"/users/{user_id}")
+        client.get("/users/999")
+        client.get("/no/such/path")
+
+        text = client.get("/metrics").text
+        assert text.startswith("# HELP")
+        ok = 'http_requests_total{method="GET",route="/users/{user_id}",status="200"}'
+        missing = 'http_requests_total{method="GET",route="/users/{user_id}",status="404"}'
+        assert self._sample(text, ok) - self._sample(before, ok) == 1
+        assert self._sample(text, missing) - self._sample(before, missing) == 1
+        assert 'route="unmatched"' in text
+        assert f'route="/users/{user_id}"' not in text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/users/",le="+Inf"}' in text
+
+    def test_db_statements_per_request(self):
+        count = 'http_request_db_statements_count{method="POST",route="/users/"}'
+        total = 'http_request_db_statements_sum{method="POST",route="/users/"}'
+        before = client.get("/metrics").text
+        client.post("/users/", json={"name": "Test User", "email": "test@example.com"})
+        text = client.get("/metrics").text
+        assert self._sample(text, count) - self._sample(before, count) == 1
+        assert self._sample(text, total) - self._sample(before, total) == 1
+        assert 'db_statements_total{operation="INSERT"}' in text
+
+    def test_background_work_not_timed(self, monkeypatch):
+        latency = 'http_request_duration_seconds_sum{method="DELETE",route="/users/{user_id}"}'
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        in_flight = []
+
+        def slow_purge(bind, uid):
+            in_flight.append(metrics.IN_FLIGHT.value())
+            time.sleep(0.3)
+
+        monkeypatch.setattr(main, "_purge_user", slow_purge)
+        before = client.get("/metrics").text
+        assert client.delete(f"/users/{user_id}", params={"background": True}).status_code == 202
+        text = client.get("/metrics").text
+        assert in_flight == [0]
+        assert self._sample(text, latency) - self._sample(before, latency) < 0.3
+
+    def test_slow_query_logged_with_plan(self, monkeypatch, caplog):
+        monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        with caplog.at_level("WARNING", logger="app.metrics"):
+            client.get(f"/users/{user_id}")
+        slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow query")]
+        assert slow
+        assert any("SEARCH users USING INTEGER PRIMARY KEY" in message for message in slow)
+
+class TestProfiling:
+    def _client(self, tmp_path, mode):
+        return TestClient(profiling.ProfilingMiddleware(app, token="secret", mode=mode, directory=str(tmp_path)))
+
+    @pytest.mark.parametrize("mode", ["cprofile", "stack"])
+    def test_sync_crud_routes_profiled(self, tmp_path, mode):
+        profiled = self._client(tmp_path, mode)
+        headers = {"X-Profile-Token": "secret"}
+        created = profiled.post("/users/", json={"name": "Test User", "email": "test@example.com"}, headers=headers)
+        assert created.status_code == 201
+        user_id = created.json()["id"]
+
+        response = profiled.get(f"/users/{user_id}", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["email"] == "test@example.com"
+        assert (tmp_path / response.headers["x-profile-file"]).exists()
+
+    def test_inline_cprofile_of_sync_route(self, tmp_path):
+        profiled = self._client(tmp_path, "cprofile")
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+
+        report = profiled.get(f"/users/{user_id}", headers={"X-Profile-Token": "secret", "X-Profile-Output": "inline"})
+        assert report.status_code == 200
+        assert "read_user" in report.text
+
+class TestSerialization:
+    def test_fast_path_matches_response_model(self):
+        user_id = client.post("/users/", json={"name": "Test User", "email": "test@example.com"}).json()["id"]
+        client.post("/orders/", params={"user_id": user_id}, json={"product_name": "Test Product", "quantity": 2})
+
+        db = TestingSessionLocal()
+        try:
+            db_user = db.get(User, user_id)
+            expected = schemas.User.model_validate(db_user).model_dump(mode="json")
+            assert json.loads(serialization.dumps(serialization.user_to_dict(db_user))) == expected
+        finally:
+            db.close()
+
+    def test_bulk_result_encodes_returning_rows(self):
+        response = client.post("/users/bulk", json=[{"name": "A", "email": "a@example.com"}])
+        assert response.headers["content-type"] == "application/json"
+        serialization.USER_BULK_RESULT.validate_python(response.json())
@@ -0,0 +1,89 @@
+import sys
+from pathlib import Path
+from sqlalchemy import inspect, text
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import create_db_engine
+from app.migrations import run_migrations
+from app.stats import check
+
+# Schema as created by create_all() before the cascade moved into the database
+LEGACY_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, name VARCHAR NOT NULL, email VARCHAR NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), PRIMARY KEY (id))""",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    """CREATE TABLE orders (
+        id INTEGER NOT NULL, user_id INTEGER, product_name VARCHAR NOT NULL,
+        quantity INTEGER NOT NULL, order_date DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        PRIMARY KEY (id), CONSTRAINT quantity_positive CHECK (quantity > 0),
+        FOREIGN KEY(user_id) REFERENCES users (id))""",
+    "CREATE INDEX ix_orders_id ON orders (id)",
+]
+
+def _legacy_engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO users (id, name, email) VALUES (1, 'A', 'a@example.com')")
+        conn.exec_driver_sql("INSERT INTO users (id, name, email) VALUES (2, 'B', 'b@example.com')")
+        conn.exec_driver_sql(
+            "INSERT INTO orders (id, user_id, product_name, quantity) "
+            "VALUES (1, 1, 'P', 1), (2, 1, 'P', 2), (3, 2, 'P', 3)"
+        )
+    return engine
+
+def test_orders_fk_gets_on_delete_cascade(tmp_path):
+    engine = _legacy_engine(tmp_path)
+
+    assert run_migrations(engine) == ["orders_user_fk_on_delete_cascade", "backfill_order_stats", "search_index"]
+    fk = inspect(engine).get_foreign_keys("orders")[0]
+    assert fk["options"]["ondelete"] == "CASCADE"
+    assert {index["name"] for index in inspect(engine).get_indexes("orders")} >= {"ix_orders_id"}
+
+    with engine.begin() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM orders")) == 3
+        conn.execute(text("DELETE FROM users WHERE id = 1"))
+        assert conn.scalars(text("SELECT id FROM orders")).all() == [3]
+
+def test_orders_index_added_without_rebuild(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_orders_user_id_order_date")
+
+    assert run_migrations(engine) == ["orders_user_id_order_date_index"]
+    index = next(
+        index for index in inspect(engine).get_indexes("orders")
+        if index["name"] == "ix_orders_user_id_order_date"
+    )
+    assert index["column_names"] == ["user_id", "order_date"]
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM orders")) == 3
+
+def test_order_stats_backfilled(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    run_migrations(engine)
+    assert check(engine) == []
+    with engine.connect() as conn:
+        assert conn.execute(
+            text("SELECT product_name, order_count, total_quantity FROM product_stats")
+        ).all() == [("P", 3, 6)]
+
+def test_search_index_built_for_existing_rows(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        assert conn.scalars(text("SELECT rowid FROM users_fts WHERE users_fts MATCH 'b*'")).all() == [2]
+        # The orders rebuild must not have left orders_fts without its triggers
+        conn.exec_driver_sql("INSERT INTO orders (id, user_id, product_name, quantity) VALUES (4, 2, 'Gadget', 1)")
+        assert conn.scalars(text("SELECT rowid FROM orders_fts WHERE orders_fts MATCH 'gad*'")).all() == [4]
+
+def test_migrations_are_idempotent(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    run_migrations(engine)
+    assert run_migrations(engine) == []
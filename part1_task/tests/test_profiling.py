@@ -0,0 +1,182 @@
+import asyncio
+import os
+import pstats
+import sys
+import time
+from pathlib import Path
+import pytest
+import httpx
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import profiling
+from app.profiling import ProfiledRoute, ProfilingMiddleware
+
+def busy_handler_work():
+    # Long enough for the stack sampler to catch it a few times
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return 42
+
+def other_request_work():
+    return sum(range(1000))
+
+def make_app(**options):
+    app = FastAPI()
+    release = asyncio.Event()
+    app.router.route_class = ProfiledRoute
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": item_id, "value": busy_handler_work()}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/wait")
+    async def wait_for_release():
+        await release.wait()
+        return {"value": busy_handler_work()}
+
+    @app.get("/other")
+    async def other():
+        return {"value": other_request_work()}
+
+    app.include_router(router)
+    app.add_middleware(ProfilingMiddleware, **{"token": "secret", **options})
+    app.state.release = release
+    return app
+
+class TestProfiling:
+    def test_unprofiled_without_token(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/items/1", headers={"X-Profile-Token": "wrong"})
+        assert response.status_code == 200
+        assert response.json() == {"id": 1, "value": 42}
+        assert "x-profile-file" not in response.headers
+        assert os.listdir(tmp_path) == []
+
+    def test_no_token_configured_disables_header(self, tmp_path):
+        client = TestClient(make_app(token="", directory=str(tmp_path)))
+
+        response = client.get("/items/1", headers={"X-Profile-Token": ""})
+        assert "x-profile-file" not in response.headers
+        assert os.listdir(tmp_path) == []
+
+    def test_inline_cprofile_covers_threadpool_handler(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/items/1", headers={
+            "X-Profile-Token": "secret", "X-Profile-Output": "inline"
+        })
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "busy_handler_work" in response.text
+        assert "function calls" in response.text
+        assert os.listdir(tmp_path) == []
+
+    def test_inline_report_keeps_status(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/items/abc", headers={
+            "X-Profile-Token": "secret", "X-Profile-Output": "inline"
+        })
+        assert response.status_code == 422
+        assert response.text == "No handler ran for this request\n"
+
+    def test_no_file_when_no_handler_ran(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/items/abc", headers={"X-Profile-Token": "secret"})
+        assert response.status_code == 422
+        assert "x-profile-file" not in response.headers
+        assert os.listdir(tmp_path) == []
+
+    def test_repeated_sync_requests_in_cprofile_mode(self, tmp_path):
+        # One profiler per request: a second one would fail to enable on 3.12+
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        for item_id in range(3):
+            response = client.get(f"/items/{item_id}", headers={"X-Profile-Token": "secret"})
+            assert response.status_code == 200
+        assert len(os.listdir(tmp_path)) == 3
+
+    async def _wait_and_other(self, app, headers):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            waiting = asyncio.ensure_future(client.get("/wait", headers=headers))
+            await asyncio.sleep(0.05)
+            other = await client.get("/other")
+            app.state.release.set()
+            return await waiting, other
+
+    @pytest.mark.parametrize("mode", ["cprofile", "stack"])
+    def test_async_handler_excludes_other_requests(self, tmp_path, mode):
+        app = make_app(directory=str(tmp_path), interval=0.001)
+        headers = {"X-Profile-Token": "secret", "X-Profile-Mode": mode, "X-Profile-Output": "inline"}
+
+        waiting, other = asyncio.run(self._wait_and_other(app, headers))
+        assert other.json() == {"value": 499500}
+        assert waiting.status_code == 200
+        assert "busy_handler_work" in waiting.text
+        assert "other_request_work" not in waiting.text
+
+    def test_profile_written_to_file(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/items/7", headers={"X-Profile-Token": "secret"})
+        assert response.json() == {"id": 7, "value": 42}
+        name = response.headers["x-profile-file"]
+        assert name.endswith(".prof") and "-GET-items_7-" in name
+        assert os.listdir(tmp_path) == [name]
+
+        functions = {func for _, _, func in pstats.Stats(str(tmp_path / name)).stats}
+        assert "busy_handler_work" in functions
+
+    def test_stack_mode_writes_folded_stacks(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path), interval=0.001))
+
+        response = client.get("/items/1", headers={
+            "X-Profile-Token": "secret", "X-Profile-Mode": "stack", "X-Profile-Output": "inline"
+        })
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert lines
+        # "<thread>;<outermost frame>;...;<innermost frame> <count>"
+        worker = [line for line in lines if line.startswith("worker;")]
+        assert any("busy_handler_work" in line for line in worker)
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    def test_unknown_mode_uses_default(self, tmp_path):
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        response = client.get("/ping", headers={"X-Profile-Token": "secret", "X-Profile-Mode": "perf"})
+        assert response.headers["x-profile-file"].endswith(".prof")
+
+    def test_sampling(self, tmp_path):
+        client = TestClient(make_app(token="", sample_rate=1.0, mode="stack", directory=str(tmp_path)))
+        before = profiling.PROFILED.value("sample")
+
+        response = client.get("/ping")
+        assert response.json() == {"ok": True}
+        # Written, but not disclosed to an unauthenticated client
+        assert not [name for name in response.headers if name.startswith("x-profile")]
+        assert [name.endswith(".folded") for name in os.listdir(tmp_path)] == [True]
+        assert profiling.PROFILED.value("sample") == before + 1
+
+    def test_old_profiles_pruned(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+        client = TestClient(make_app(directory=str(tmp_path)))
+
+        names = []
+        for _ in range(4):
+            names.append(client.get("/ping", headers={"X-Profile-Token": "secret"}).headers["x-profile-file"])
+            time.sleep(0.01)
+        assert sorted(os.listdir(tmp_path)) == sorted(names[-2:])
@@ -0,0 +1,133 @@
+import asyncio
+import sys
+from pathlib import Path
+import httpx
+import pytest
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.testclient import TestClient
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.ratelimit import AdmissionMiddleware, parse_rules
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_app(**limits):
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": item_id}
+
+    @app.post("/items/")
+    def create_item():
+        return {"id": 1}
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {"done": True}
+
+    @app.get("/metrics")
+    def read_metrics():
+        return {}
+
+    @app.post("/jobs/")
+    def create_job(background_tasks: BackgroundTasks):
+        background_tasks.add_task(app.state.job)
+        return {"queued": True}
+
+    app.add_middleware(AdmissionMiddleware, **limits)
+    return app, release
+
+class TestRateLimits:
+    def test_burst_then_retry_after(self):
+        clock = FakeClock()
+        app, _ = make_app(rate_limits="GET=1:2", clock=clock)
+        client = TestClient(app)
+
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+        response = client.get("/items/3")
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert response.json()["detail"] == "Rate limit exceeded"
+
+        clock.now += 1
+        assert client.get("/items/3").status_code == 200
+
+    def test_buckets_are_per_api_key(self):
+        app, _ = make_app(rate_limits="GET=1:1", clock=FakeClock())
+        client = TestClient(app)
+
+        assert client.get("/items/1", headers={"X-API-Key": "a"}).status_code == 200
+        assert client.get("/items/1", headers={"X-API-Key": "a"}).status_code == 429
+        assert client.get("/items/1", headers={"X-API-Key": "b"}).status_code == 200
+
+    def test_most_specific_rule_wins(self):
+        app, _ = make_app(rate_limits="*=100:100;POST /items/=1:1", clock=FakeClock())
+        client = TestClient(app)
+
+        assert client.post("/items/").status_code == 200
+        assert client.post("/items/").status_code == 429
+        assert all(client.get(f"/items/{i}").status_code == 200 for i in range(10))
+
+    def test_exempt_paths(self):
+        app, _ = make_app(rate_limits="GET=1:1", clock=FakeClock())
+        client = TestClient(app)
+        assert all(client.get("/metrics").status_code == 200 for _ in range(5))
+
+    def test_invalid_rule(self):
+        with pytest.raises(ValueError):
+            parse_rules("GET")
+
+class TestConcurrencyLimits:
+    async def _run(self, app, release, paths):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.ensure_future(client.get("/slow"))
+            await asyncio.sleep(0.05)
+            responses = await asyncio.gather(*(client.get(path) for path in paths))
+            release.set()
+            return [await slow] + list(responses)
+
+    def test_sheds_when_queue_full(self):
+        app, release = make_app(max_concurrency=1, max_queue=0)
+        slow, shed = asyncio.run(self._run(app, release, ["/items/1"]))
+        assert slow.status_code == 200
+        assert shed.status_code == 503
+        assert "retry-after" in shed.headers
+
+    def test_queued_request_times_out(self):
+        app, release = make_app(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        slow, queued = asyncio.run(self._run(app, release, ["/items/1"]))
+        assert slow.status_code == 200
+        assert queued.status_code == 503
+
+    def test_route_concurrency_leaves_other_routes_alone(self):
+        app, release = make_app(concurrency_limits="GET /slow=1", max_queue=0)
+        slow, other, second_slow = asyncio.run(self._run(app, release, ["/items/1", "/slow"]))
+        assert slow.status_code == 200
+        assert other.status_code == 200
+        assert second_slow.status_code == 503
+
+    def test_background_task_releases_slot(self):
+        # The task runs inside the app call, after the response was sent
+        app, _ = make_app(max_concurrency=1, max_queue=0)
+        during = []
+
+        async def job():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                during.append((await client.get("/items/1")).status_code)
+
+        app.state.job = job
+        assert TestClient(app).post("/jobs/").status_code == 200
+        assert during == [200]
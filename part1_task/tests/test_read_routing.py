@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import cache, database
+from app.main import app
+from app.database import Base, create_db_engine, create_read_engine, get_db
+from app.models import User
+
+@pytest.fixture
+def routed(tmp_path, monkeypatch):
+    """A primary and a separate "replica" file that never catches up, so a
+    read that reaches the replica cannot see anything written through the API"""
+    primary = create_db_engine(f"sqlite:///{tmp_path}/primary.db")
+    replica_path = tmp_path / "replica.db"
+    Base.metadata.create_all(bind=create_db_engine(f"sqlite:///{replica_path}"))
+    replica = create_read_engine(f"sqlite:///file:{replica_path}?mode=ro&uri=true")
+    Base.metadata.create_all(bind=primary)
+    PrimarySession = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+    ReplicaSession = sessionmaker(autocommit=False, autoflush=False, bind=replica, info={"may_lag": True})
+
+    def override_get_db():
+        db = PrimarySession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(database, "ReadSessionLocals", [ReplicaSession])
+    monkeypatch.setattr(database, "_read_sessions", iter(lambda: ReplicaSession, None))
+    database._recent_writes.clear()
+    cache.backend.clear()
+    yield primary, replica, replica_path
+    database._recent_writes.clear()
+    cache.backend.clear()
+    primary.dispose()
+    replica.dispose()
+
+def test_reads_go_to_the_replica(routed):
+    primary, _, _ = routed
+    with primary.begin() as conn:
+        conn.execute(insert(User).values(id=1, name="Old", email="old@example.com"))
+
+    client = TestClient(app)
+    assert client.get("/users/1").status_code == 404
+    assert client.get("/users/").json()["items"] == []
+
+def test_writer_reads_its_own_writes(routed):
+    writer = TestClient(app, headers={"X-API-Key": "writer"})
+    other = TestClient(app, headers={"X-API-Key": "other"})
+    user_id = writer.post("/users/", json={"name": "New", "email": "new@example.com"}).json()["id"]
+
+    assert other.get(f"/users/{user_id}").status_code == 404
+    assert writer.get(f"/users/{user_id}").status_code == 200
+
+def test_stickiness_expires(routed, monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_WINDOW", 0)
+    writer = TestClient(app, headers={"X-API-Key": "writer"})
+    user_id = writer.post("/users/", json={"name": "New", "email": "new@example.com"}).json()["id"]
+    assert writer.get(f"/users/{user_id}").status_code == 404
+
+def test_stickiness_starts_after_a_slow_write(routed, monkeypatch):
+    primary, _, _ = routed
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_WINDOW", 0.5)
+    # A write that takes longer than the whole window
+    event.listen(primary, "commit", lambda conn: time.sleep(0.8))
+    writer = TestClient(app, headers={"X-API-Key": "writer"})
+    user_id = writer.post("/users/", json={"name": "New", "email": "new@example.com"}).json()["id"]
+    assert writer.get(f"/users/{user_id}").status_code == 200
+
+def test_read_engines_instrumented(tmp_path):
+    # main builds the read engines at import, from DATABASE_READ_URLS
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp_path}/primary.db",
+        "DATABASE_READ_URLS": f"sqlite:///{tmp_path}/primary.db",
+    }
+    check = (
+        "from sqlalchemy import event; from app import main, metrics; "
+        "assert main.read_engines; "
+        "assert all(event.contains(e, 'before_cursor_execute', metrics._before_cursor_execute) "
+        "for e in main.read_engines)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check], cwd=Path(__file__).parent.parent, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+def test_lagging_reads_are_not_cached(routed):
+    _, _, replica_path = routed
+    # Seed the replica behind the read-only engine's back
+    with create_db_engine(f"sqlite:///{replica_path}").begin() as conn:
+        conn.execute(insert(User).values(id=7, name="Replica", email="replica@example.com"))
+
+    assert TestClient(app).get("/users/7").status_code == 200
+    assert cache.backend.size() == 0
+
+def test_read_engine_refuses_writes(routed):
+    _, replica, _ = routed
+    with pytest.raises(OperationalError):
+        with replica.begin() as conn:
+            conn.execute(text("DELETE FROM users"))
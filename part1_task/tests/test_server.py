@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+# Add the parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import server
+
+def test_defaults(monkeypatch):
+    for name in ("WEB_CONCURRENCY", "BIND", "PORT", "MAX_REQUESTS"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(server, "default_workers", lambda: 6)
+    options = server.options()
+    assert options["workers"] == 6
+    assert options["bind"] == "0.0.0.0:8000"
+    assert options["preload_app"] is True
+    assert options["max_requests"] == 10000
+    assert options["max_requests_jitter"] > 0
+
+def test_environment_overrides(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("BACKLOG", "4096")
+    options = server.options()
+    assert options["workers"] == 3
+    assert options["bind"].endswith(":9000")
+    assert options["backlog"] == 4096
+
+def test_default_workers_follow_cpus():
+    assert server.default_workers() >= 1
@@ -1,7 +1,10 @@
 # main.py
 import asyncio
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List
 from processors.gemini_processor import GeminiProcessor
 from processors.llama_processor import LlamaProcessor
 from utils.comparison import ModelComparison
@@ -10,29 +13,49 @@ import json
 
 load_dotenv()
 
+def _run_coroutine(function, *args):
+    """Run an async function to completion on the calling (executor) thread"""
+    return asyncio.run(function(*args))
+
 class Pipeline:
-    def __init__(self):
+    def __init__(self, max_in_flight: int = None):
         """Initialize processing pipeline"""
         print("Initializing processors...")
         self.gemini_processor = GeminiProcessor()
         self.llama_processor = LlamaProcessor()
         self.comparison_tool = ModelComparison()
+
+        # LLaMA inference is CPU-bound and blocks whatever thread runs it, so it
+        # gets its own thread; one worker, as a model instance is not thread-safe
+        self.llama_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llama')
+        # Texts process_many works on at once: enough to keep Gemini calls
+        # ahead of LLaMA without holding the whole corpus in flight
+        self.max_in_flight = max_in_flight or int(os.getenv('PIPELINE_MAX_IN_FLIGHT', '16'))
         
         # Create output directories
         os.makedirs('output/processed', exist_ok=True)
         os.makedirs('output/comparisons', exist_ok=True)
 
+    def close(self):
+        """Shut down the LLaMA executor"""
+        self.llama_executor.shutdown(wait=True)
+
+    async def _process_llama(self, text: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.llama_executor, _run_coroutine, self.llama_processor.process_text, text
+        )
+
     async def process_single(self, text: str) -> dict:
         """Process single text through both models"""
         try:
-            print("\nProcessing with Gemini...")
-            gemini_result = await self.gemini_processor.process_text(text)
-            print("Gemini processing complete.")
+            # Gemini waits on the network while LLaMA runs on its own thread
+            print("\nProcessing with Gemini and LLaMA...")
+            gemini_result, llama_result = await asyncio.gather(
+                self.gemini_processor.process_text(text),
+                self._process_llama(text)
+            )
             print("Gemini result:", gemini_result.model_dump())  # Updated from dict() to model_dump()
-
-            print("\nProcessing with LLaMA...")
-            llama_result = await self.llama_processor.process_text(text)
-            print("LLaMA processing complete.")
             print("LLaMA result:", llama_result.model_dump())  # Updated from dict() to model_dump()
             
             # Compare results
@@ -58,6 +81,82 @@ class Pipeline:
             print(traceback.format_exc())
             return None
 
+    async def process_many(self, texts: List[str]) -> dict:
+        """
+        Process a corpus through both models
+
+        Texts are processed concurrently, up to max_in_flight at a time: Gemini
+        calls (rate-limited and retried by GeminiProcessor.batch_process), LLaMA
+        inference on its executor and the comparison of each finished text all
+        overlap. Comparisons are saved together in one file.
+
+        Args:
+            texts (List[str]): Input texts
+
+        Returns:
+            dict: "comparisons", in input order with None for texts that failed
+            in either model or in the comparison, and "throughput" for the
+            whole run
+        """
+        slots = asyncio.Semaphore(self.max_in_flight)
+        started = time.perf_counter()
+        gemini_failed = llama_failed = comparison_failed = 0
+
+        async def process_item(index: int, text: str):
+            # Every failure stays in its own slot, so one text never costs the run
+            nonlocal gemini_failed, llama_failed, comparison_failed
+            async with slots:
+                gemini_results, llama_result = await asyncio.gather(
+                    self.gemini_processor.batch_process([text]),
+                    self._process_llama(text),
+                    return_exceptions=True
+                )
+            if isinstance(gemini_results, Exception):
+                print(f"Gemini failed on text {index}: {str(gemini_results)}")
+                gemini_result = None
+            else:
+                [gemini_result] = gemini_results
+            if isinstance(llama_result, Exception):
+                print(f"LLaMA failed on text {index}: {str(llama_result)}")
+                llama_failed += 1
+            if gemini_result is None:
+                gemini_failed += 1
+            if gemini_result is None or isinstance(llama_result, Exception):
+                return None
+            try:
+                comparison = self.comparison_tool.compare_responses(gemini_result, llama_result)
+            except Exception as e:
+                print(f"Comparison failed on text {index}: {str(e)}")
+                comparison_failed += 1
+                return None
+            comparison['index'] = index
+            return comparison
+
+        comparisons = await asyncio.gather(*(process_item(i, text) for i, text in enumerate(texts)))
+        elapsed = time.perf_counter() - started
+
+        completed = sum(1 for comparison in comparisons if comparison is not None)
+        throughput = {
+            "texts": len(texts),
+            "completed": completed,
+            "gemini_failed": gemini_failed,
+            "llama_failed": llama_failed,
+            "comparison_failed": comparison_failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "texts_per_second": round(completed / elapsed, 3) if elapsed else 0.0,
+        }
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filepath = f'output/comparisons/corpus_{timestamp}.json'
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump({"throughput": throughput, "comparisons": comparisons}, f, indent=2, default=str)
+
+        print(f"\nProcessed {completed}/{len(texts)} texts in {elapsed:.1f}s "
+              f"({throughput['texts_per_second']} texts/s); "
+              f"failures: Gemini {gemini_failed}, LLaMA {llama_failed}, comparison {comparison_failed}")
+        print(f"Comparisons saved to: {filepath}")
+        return {"comparisons": comparisons, "throughput": throughput}
+
 async def main():
     print("Starting the pipeline...")
     pipeline = Pipeline()
@@ -70,7 +169,10 @@ async def main():
     """
     
     print("\nProcessing text sample...")
-    result = await pipeline.process_single(text)
+    try:
+        result = await pipeline.process_single(text)
+    finally:
+        pipeline.close()
     
     if result:
         print("\nProcessing complete! Final comparison:")
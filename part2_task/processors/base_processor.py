@@ -1,6 +1,6 @@
 # processors/base_processor.py
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Union
 from models.pydantic_models import ProcessedData
 
 class BaseProcessor(ABC):
@@ -18,15 +18,27 @@ class BaseProcessor(ABC):
         pass
 
     @abstractmethod
-    async def batch_process(self, texts: List[str]) -> List[Optional[ProcessedData]]:
+    async def batch_process(
+        self, texts: List[str], return_exceptions: bool = False
+    ) -> List[Union[ProcessedData, Exception, None]]:
         """
         Process multiple texts
         
+        Implementations may process texts concurrently, but must keep the
+        concurrency bounded and stay within the backend's rate limits, backing
+        off when it reports throttling. A failed text must not fail the batch:
+        its error is logged and reported in its own slot, and the other texts
+        are still processed.
+        
         Args:
             texts (List[str]): List of input texts
+            return_exceptions (bool): Put the exception in a failed text's
+                slot instead of None
             
         Returns:
-            List[Optional[ProcessedData]]: List of processing results
+            List[Union[ProcessedData, Exception, None]]: One entry per input
+            text, in input order: the result, or None (the exception, with
+            return_exceptions) if that text failed
         """
         pass
 
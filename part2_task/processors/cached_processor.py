@@ -0,0 +1,130 @@
+# processors/cached_processor.py
+import diskcache
+import hashlib
+import json
+import os
+from typing import List, Optional, Union
+from pydantic import ValidationError as PydanticValidationError
+from .base_processor import BaseProcessor
+from models.pydantic_models import ProcessedData
+
+# Bump when the stored format changes, to start from an empty cache
+CACHE_FORMAT_VERSION = 1
+
+class CachedProcessor(BaseProcessor):
+    """
+    Persistent, content-addressed cache in front of any processor.
+
+    Results are keyed on a hash of the processor class, its model info (model
+    name and generation config, from get_model_info()), its prompt template and
+    the text. The fingerprint is recomputed on every call, so editing the prompt
+    or the config misses the old entries instead of serving stale results.
+    Entries are stored on disk by diskcache, expire after `ttl` seconds, and the
+    least recently used ones are evicted beyond `size_limit` bytes.
+
+        processor = CachedProcessor(GeminiProcessor())
+        result = await processor.process_text(text)
+        print(processor.stats())
+    """
+
+    def __init__(
+        self,
+        processor: BaseProcessor,
+        directory: Optional[str] = None,
+        ttl: Optional[float] = None,
+        size_limit: Optional[int] = None
+    ):
+        self.processor = processor
+        self.ttl = ttl if ttl is not None else float(os.getenv('LLM_CACHE_TTL', '0')) or None
+        self.cache = diskcache.Cache(
+            directory or os.getenv('LLM_CACHE_DIR', 'output/cache'),
+            size_limit=size_limit or int(os.getenv('LLM_CACHE_SIZE_LIMIT', str(2 ** 30))),
+            eviction_policy='least-recently-used'
+        )
+        self.hits = 0
+        self.misses = 0
+
+    async def _fingerprint(self) -> str:
+        config = {
+            "version": CACHE_FORMAT_VERSION,
+            "processor": type(self.processor).__name__,
+            "model": await self.processor.get_model_info(),
+            "prompt_template": getattr(self.processor, 'prompt_template', None),
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _key(fingerprint: str, text: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\0{text}".encode()).hexdigest()
+
+    def _get(self, key: str) -> Optional[ProcessedData]:
+        value = self.cache.get(key)
+        if value is not None:
+            try:
+                result = ProcessedData.model_validate(value)
+            except PydanticValidationError:
+                # Stored under an older ProcessedData schema
+                self.cache.delete(key)
+            else:
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def _set(self, key: str, result: ProcessedData) -> None:
+        self.cache.set(key, result.model_dump(mode='json'), expire=self.ttl)
+
+    async def process_text(self, text: str) -> ProcessedData:
+        key = self._key(await self._fingerprint(), text)
+        result = self._get(key)
+        if result is None:
+            result = await self.processor.process_text(text)
+            self._set(key, result)
+        return result
+
+    async def batch_process(
+        self, texts: List[str], return_exceptions: bool = False
+    ) -> List[Union[ProcessedData, Exception, None]]:
+        """Serve hits from the cache and send the distinct misses to the wrapped processor as one batch"""
+        fingerprint = await self._fingerprint()
+        keys = [self._key(fingerprint, text) for text in texts]
+        found = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            result = self._get(key)
+            if result is None:
+                missing[key] = text
+            else:
+                found[key] = result
+
+        if missing:
+            results = await self.processor.batch_process(list(missing.values()), return_exceptions=True)
+            for key, result in zip(missing, results):
+                if isinstance(result, ProcessedData):
+                    self._set(key, result)
+                elif result is not None and not return_exceptions:
+                    result = None
+                found[key] = result
+        return [found[key] for key in keys]
+
+    def validate_response(self, response: dict) -> bool:
+        return self.processor.validate_response(response)
+
+    async def get_model_info(self) -> dict:
+        return await self.processor.get_model_info()
+
+    def stats(self) -> dict:
+        """Hit rate since this instance was created, and the cache's current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+        }
+
+    def close(self):
+        self.cache.close()
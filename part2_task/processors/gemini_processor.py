@@ -1,22 +1,61 @@
 # processors/gemini_processor.py
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from datetime import datetime
 from .base_processor import BaseProcessor
 from models.pydantic_models import ProcessedData
+from utils.error_handlers import log_error
+from utils.rate_limiter import AdaptiveConcurrencyLimiter, RateLimiter
+from typing import List, Optional, Union
+import asyncio
 import os
+import random
 from dotenv import load_dotenv
 import json
 
 load_dotenv()
 
+# Errors the API returns for HTTP 429
+THROTTLED = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+# Rough output size, reserved against the tokens-per-minute limit until the
+# response reports its real usage
+EXPECTED_OUTPUT_TOKENS = 256
+
 class GeminiProcessor(BaseProcessor):
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ):
         api_key = os.getenv('GEMINI_API_KEY')
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
             
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
+        self.model_name = 'gemini-pro'
+        self.model = genai.GenerativeModel(self.model_name)
+        self.generation_config = {
+            "temperature": 0.1,
+            "top_p": 0.8,
+            "top_k": 40,
+            "max_output_tokens": 1024,
+        }
+
+        # Quotas are per API key: set these to your tier's limits (0 disables a limit)
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=requests_per_minute if requests_per_minute is not None
+            else int(os.getenv('GEMINI_RPM', '60')),
+            tokens_per_minute=tokens_per_minute if tokens_per_minute is not None
+            else int(os.getenv('GEMINI_TPM', '0'))
+        )
+        # Calls in flight; halved on each burst of 429s, then regrown
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            max_concurrency or int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('GEMINI_MAX_RETRIES', '5'))
         
         # New structured prompt
         self.prompt_template = """You are a text analysis system. Analyze the following text and provide the results in JSON format.
@@ -41,19 +80,8 @@ Example of expected format:
     async def process_text(self, text: str) -> ProcessedData:
         """Process text using Gemini API"""
         try:
-            # Set specific generation config
-            generation_config = {
-                "temperature": 0.1,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 1024,
-            }
-
             # Generate response
-            response = await self.model.generate_content_async(
-                contents=self.prompt_template.format(text=text),
-                generation_config=generation_config,
-            )
+            response = await self._generate(self.prompt_template.format(text=text), self.generation_config)
 
             # Print raw response for debugging
             print("\nRaw Gemini response:", response.text)
@@ -100,16 +128,51 @@ Example of expected format:
             print(f"Response text: {response.text if 'response' in locals() else 'No response generated'}")
             raise
 
-    async def batch_process(self, texts: list[str]) -> list[ProcessedData]:
-        results = []
-        for text in texts:
+    async def _generate(self, prompt: str, generation_config: dict):
+        """Call the API within the requests- and tokens-per-minute limits"""
+        # About four characters per token for English text
+        estimate = len(prompt) // 4 + EXPECTED_OUTPUT_TOKENS
+        await self.rate_limiter.acquire(estimate)
+        response = await self.model.generate_content_async(
+            contents=prompt,
+            generation_config=generation_config,
+        )
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and usage.total_token_count:
+            self.rate_limiter.record_usage(estimate, usage.total_token_count)
+        return response
+
+    async def _process_with_backoff(self, text: str) -> ProcessedData:
+        """Process one text in a concurrency slot, retrying with backoff on 429s"""
+        for attempt in range(self.max_retries + 1):
+            started = await self.concurrency.acquire()
             try:
                 result = await self.process_text(text)
-                results.append(result)
+            except THROTTLED:
+                self.concurrency.on_throttle(started)
+                if attempt == self.max_retries:
+                    raise
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                await self.concurrency.release()
+            # Exponential backoff with jitter, outside the slot
+            await asyncio.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1))
+
+    async def batch_process(
+        self, texts: List[str], return_exceptions: bool = False
+    ) -> List[Union[ProcessedData, Exception, None]]:
+        """Process texts concurrently; see BaseProcessor.batch_process for the contract"""
+        async def process_item(index: int, text: str):
+            try:
+                return await self._process_with_backoff(text)
             except Exception as e:
-                print(f"Error in batch processing: {str(e)}")
-                results.append(None)
-        return results
+                log_error(e, f"Gemini batch item {index}")
+                return e if return_exceptions else None
+
+        # gather() keeps input order whatever order the calls finish in
+        return list(await asyncio.gather(*(process_item(i, text) for i, text in enumerate(texts))))
 
     def validate_response(self, response: dict) -> bool:
         required_fields = {'sentiment', 'key_topics', 'summary', 'confidence_score'}
@@ -117,8 +180,6 @@ Example of expected format:
 
     async def get_model_info(self) -> dict:
         return {
-            "model_name": "gemini-pro",
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "top_k": 40
+            "model_name": self.model_name,
+            **self.generation_config
         }
\ No newline at end of file
@@ -0,0 +1,97 @@
+# tests/test_gemini_batch.py
+import asyncio
+import itertools
+import sys
+import os
+from datetime import datetime
+import pytest
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.generativeai")
+
+from google.api_core import exceptions as google_exceptions
+from models.pydantic_models import ProcessedData
+from processors import gemini_processor
+from processors.gemini_processor import GeminiProcessor
+from utils.rate_limiter import AdaptiveConcurrencyLimiter
+
+def make_result(text: str) -> ProcessedData:
+    return ProcessedData(
+        sentiment="neutral",
+        key_topics=[text],
+        summary=text,
+        confidence_score=0.5,
+        timestamp=datetime.now()
+    )
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    # No backoff between retries
+    monkeypatch.setattr(gemini_processor.random, "uniform", lambda a, b: 0)
+    processor = GeminiProcessor(max_concurrency=4, requests_per_minute=0, max_retries=2)
+    processor.concurrency = AdaptiveConcurrencyLimiter(4, clock=itertools.count().__next__)
+    return processor
+
+def test_batch_keeps_order_and_isolates_failures(processor):
+    async def process_text(text):
+        # Finish in reverse order of submission
+        await asyncio.sleep(0.01 * (10 - int(text)))
+        if text == "3":
+            raise ValueError("bad response")
+        return make_result(text)
+
+    processor.process_text = process_text
+    texts = [str(i) for i in range(8)]
+
+    async def run():
+        return (
+            await processor.batch_process(texts),
+            await processor.batch_process(texts, return_exceptions=True)
+        )
+
+    results, with_exceptions = asyncio.run(run())
+    assert [r.summary if r else None for r in results] == ["0", "1", "2", None, "4", "5", "6", "7"]
+    assert isinstance(with_exceptions[3], ValueError)
+    assert with_exceptions[4].summary == "4"
+
+def test_throttle_burst_halves_once_and_retries(processor):
+    attempts = {}
+    limits = []
+
+    async def process_text(text):
+        limits.append(processor.concurrency.limit)
+        attempts[text] = attempts.get(text, 0) + 1
+        # Let the whole first wave start before any of it is throttled
+        await asyncio.sleep(0.01)
+        if attempts[text] == 1:
+            raise google_exceptions.ResourceExhausted("quota")
+        return make_result(text)
+
+    processor.process_text = process_text
+    results = asyncio.run(processor.batch_process([str(i) for i in range(4)]))
+
+    assert [r.summary for r in results] == ["0", "1", "2", "3"]
+    assert attempts == {"0": 2, "1": 2, "2": 2, "3": 2}
+    # Four 429s from calls that started together halve the limit once
+    assert limits[:4] == [4, 4, 4, 4]
+    assert min(limits) == 2
+
+def test_throttled_item_fails_after_retries(processor):
+    attempts = []
+
+    async def process_text(text):
+        if text == "throttled":
+            attempts.append(text)
+            raise google_exceptions.ResourceExhausted("quota")
+        return make_result(text)
+
+    processor.process_text = process_text
+    results = asyncio.run(processor.batch_process(["ok", "throttled"], return_exceptions=True))
+
+    assert results[0].summary == "ok"
+    assert isinstance(results[1], google_exceptions.ResourceExhausted)
+    assert len(attempts) == processor.max_retries + 1
+    assert processor.concurrency.limit >= processor.concurrency.minimum
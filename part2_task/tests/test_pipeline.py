@@ -0,0 +1,59 @@
+# tests/test_pipeline.py
+import asyncio
+import json
+import sys
+import os
+import pytest
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("llama_cpp")
+
+from main import Pipeline
+
+class FakeGemini:
+    async def batch_process(self, texts, return_exceptions=False):
+        if texts == ["gemini batch error"]:
+            raise RuntimeError("batch failed")
+        return [None if text == "gemini item error" else f"gemini:{text}" for text in texts]
+
+class FakeComparison:
+    def compare_responses(self, gemini_result, llama_result):
+        if gemini_result == "gemini:comparison error":
+            raise KeyError("sentiment")
+        return {"gemini": gemini_result, "llama": llama_result}
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('output/comparisons')
+    pipeline = Pipeline.__new__(Pipeline)
+    pipeline.gemini_processor = FakeGemini()
+    pipeline.comparison_tool = FakeComparison()
+    pipeline.max_in_flight = 2
+
+    async def process_llama(text):
+        if text == "llama error":
+            raise ValueError("inference failed")
+        return f"llama:{text}"
+
+    pipeline._process_llama = process_llama
+    return pipeline
+
+def test_failures_stay_in_their_slot(pipeline):
+    texts = ["a", "gemini batch error", "gemini item error", "llama error", "comparison error", "b"]
+
+    result = asyncio.run(pipeline.process_many(texts))
+
+    comparisons = result["comparisons"]
+    assert [c["index"] if c else None for c in comparisons] == [0, None, None, None, None, 5]
+    assert comparisons[5] == {"gemini": "gemini:b", "llama": "llama:b", "index": 5}
+    throughput = result["throughput"]
+    assert (throughput["completed"], throughput["gemini_failed"]) == (2, 2)
+    assert (throughput["llama_failed"], throughput["comparison_failed"]) == (1, 1)
+
+    [saved] = os.listdir('output/comparisons')
+    with open(os.path.join('output/comparisons', saved)) as f:
+        assert json.load(f)["comparisons"][0]["index"] == 0
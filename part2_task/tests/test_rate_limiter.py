@@ -0,0 +1,100 @@
+# tests/test_rate_limiter.py
+import asyncio
+import itertools
+import time
+import sys
+import os
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rate_limiter import AdaptiveConcurrencyLimiter, RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_rate_limiter_paces_after_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=60, clock=clock)
+    limiter._requests = 1
+
+    async def run():
+        await limiter.acquire()
+        assert limiter._wait_time(0) == 1.0
+        clock.now += 0.25
+        limiter._refill()
+        assert limiter._wait_time(0) == 0.75
+
+    asyncio.run(run())
+
+def test_oversized_request_waits_for_full_bucket():
+    limiter = RateLimiter(tokens_per_minute=600, clock=FakeClock())
+    limiter._tokens = 0
+    assert limiter._wait_time(6000) == 60.0
+
+def test_throttle_burst_halves_once():
+    clock = FakeClock()
+    limiter = AdaptiveConcurrencyLimiter(8, clock=clock)
+
+    async def run():
+        first = await limiter.acquire()
+        second = await limiter.acquire()
+        clock.now = 1
+        limiter.on_throttle(first)
+        limiter.on_throttle(second)
+        assert limiter.limit == 4
+        clock.now = 2
+        third = await limiter.acquire()
+        limiter.on_throttle(third)
+        assert limiter.limit == 2
+        assert limiter.minimum == 1
+
+    asyncio.run(run())
+
+def test_success_grows_limit_up_to_maximum():
+    limiter = AdaptiveConcurrencyLimiter(2, maximum=3)
+    limiter.on_success()
+    assert limiter.limit == 2.5
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+def test_large_batch_respects_limit_and_scales():
+    limiter = AdaptiveConcurrencyLimiter(8, clock=itertools.count().__next__)
+    peak = 0
+
+    async def item():
+        nonlocal peak
+        await limiter.acquire()
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0)
+        await limiter.release()
+
+    async def run():
+        await asyncio.gather(*(item() for _ in range(5000)))
+
+    # Waking every waiter on each release took several seconds here
+    started = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - started < 2
+    assert peak == 8
+    assert limiter.in_flight == 0
+
+def test_grown_limit_wakes_extra_waiters():
+    limiter = AdaptiveConcurrencyLimiter(1, maximum=4)
+
+    async def run():
+        await limiter.acquire()
+        waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        limiter.limit = 3
+        await limiter.release()
+        await asyncio.sleep(0)
+        assert sum(waiter.done() for waiter in waiters) == 3
+        assert limiter.in_flight == 3
+
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+# utils/rate_limiter.py
+import asyncio
+import math
+import time
+from typing import Callable, Optional
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for API calls.
+
+    Each limit is a token bucket that holds one minute of quota and refills
+    continuously, so a burst can use the full minute and is then paced at the
+    sustained rate. A limit of 0 disables that bucket.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        """Seconds until one request and `tokens` tokens are available"""
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.requests_per_minute
+        if self.tokens_per_minute:
+            # A request larger than the whole bucket waits for a full bucket
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        Wait until a request of `tokens` estimated tokens fits both limits
+
+        Args:
+            tokens (int): Estimated prompt plus output tokens
+        """
+        # The lock queues callers, so a large request is not starved by small ones
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+    def record_usage(self, estimated: int, actual: int) -> None:
+        """
+        Correct the token bucket once a response reports its real usage
+
+        Args:
+            estimated (int): Tokens reserved by acquire()
+            actual (int): Tokens the API counted for the request
+        """
+        if self.tokens_per_minute:
+            # May go negative, which delays the next requests accordingly
+            self._tokens -= actual - estimated
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Bounded semaphore whose limit adapts to throttling (AIMD).
+
+    The limit starts at `initial` and never leaves [minimum, maximum]. Each
+    successful call raises it by 1/limit, about one slot per limit's worth of
+    successes; a throttled call halves it. Calls that started before the last
+    decrease do not halve it again, so one burst of 429s counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = float(max(minimum, min(initial, self.maximum)))
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = -math.inf
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot
+
+        Returns:
+            float: Start time, to pass to on_throttle()
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self._clock()
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            # Wake one waiter per free slot (more after the limit grew): waking
+            # them all would cost O(waiters) per release for a large batch
+            self._condition.notify(max(0, int(self.limit) - self.in_flight))
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self, started: float) -> None:
+        """
+        Halve the limit after a 429
+
+        Args:
+            started (float): Value returned by acquire() for the throttled call
+        """
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit / 2)
+        self._last_decrease = self._clock()